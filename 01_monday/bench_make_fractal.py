@@ -0,0 +1,85 @@
+''' Benchmark the tiled, multi-core make_fractal_parallel against the serial
+    make_fractal from 02_mathematical_fractals.ipynb.
+
+    Run from this folder with:
+        python bench_make_fractal.py [n] [max_iters]
+'''
+import sys
+import time
+import numpy as np
+from numba import njit, get_num_threads
+
+from mathematical_fractals_utils import make_fractal_parallel, julia_cycle, quadratic_mandel
+
+# maps and sets as defined in the notebook
+@njit
+def quadratic(z, c):
+    return z**2 + c
+
+@njit
+def sinusoid(z, c):
+    return c*np.sin(z)
+
+@njit
+def complex_logistic(z, c):
+    return c*z*(1 - z)
+
+@njit
+def julia(fmap, z0, p, R=50, max_iters=500):
+    z = z0
+    for i in range(1, max_iters+1):
+        z = fmap(z, p)
+        if abs(z) >= R:
+            return i
+    return max_iters
+
+@njit
+def mandel(fmap, p, z0, R=50, max_iters=50):
+    z = z0
+    for i in range(1, max_iters+1):
+        z = fmap(z, p)
+        if abs(z) >= R:
+            return i
+    return max_iters
+
+@njit
+def make_fractal(out, fset, fmap, L, p, R=50, max_iters=500, origin=(0,0)):
+    ny, nx = out.shape
+    dx = 2*L/nx
+    dy = 2*L/ny
+    for i in range(nx):
+        x = -L + i*dx + origin[0]
+        for j in range(ny):
+            y = -L + j*dy + origin[1]
+            out[j,i] = fset(fmap, complex(x, y), p, R, max_iters)
+
+def timeit(fun, *args, **kwargs):
+    ''' Return the best wall-clock time out of three runs (after a warm-up run). '''
+    fun(*args, **kwargs)
+    times = []
+    for _ in range(3):
+        start = time.perf_counter()
+        fun(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    max_iters = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    # (name, serial set, fast set, map, parameter, L, origin)
+    cases = [('quadratic julia', julia, julia_cycle, quadratic, complex(-0.4, 0.6), 1.5, (0.,0.)),
+             ('quadratic mandel', mandel, quadratic_mandel, quadratic, complex(0., 0.), 1.5, (-0.5,0.)),
+             ('sinusoid julia', julia, julia_cycle, sinusoid, complex(-0.2, 1.), 1.5, (0.,0.)),
+             ('complex_logistic julia', julia, julia_cycle, complex_logistic, complex(-0.2, 1.), 1.25, (0.5,0.))]
+
+    print('image: %dx%d, max_iters: %d, threads: %d' % (n, n, max_iters, get_num_threads()))
+    for name, fset, fset_fast, fmap, p, L, origin in cases:
+        out = np.zeros((n, n), dtype=np.int64)
+        ref = np.zeros((n, n), dtype=np.int64)
+        t_serial = timeit(make_fractal, ref, fset, fmap, L, p, 50, max_iters, origin)
+        t_tiled = timeit(make_fractal_parallel, out, fset, fmap, L, p, 50, max_iters, origin)
+        t_fast = timeit(make_fractal_parallel, out, fset_fast, fmap, L, p, 50, max_iters, origin)
+        mismatch = np.mean(out != ref)
+        print('%-24s serial %7.3fs | tiled %7.3fs (%5.1fx) | tiled + early exits %7.3fs (%5.1fx) | mismatched pixels %.2e'
+              % (name, t_serial, t_tiled, t_serial/t_tiled, t_fast, t_serial/t_fast, mismatch))
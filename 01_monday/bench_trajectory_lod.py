@@ -0,0 +1,38 @@
+''' Benchmark plot_trajectory with and without level-of-detail decimation on
+    Lorenz trajectories over a fixed time span, sampled with more and more points.
+
+    Run from this folder with:
+        python bench_trajectory_lod.py
+'''
+import time
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from strange_attractors_utils import plot_trajectory, calc_trajectories
+
+def lorenz(t, state, args):
+    a, b, c = args
+    x, y, z = state
+    return np.array([a*(y - x),
+                     x*(b - z) - y,
+                     x*y - c*z])
+
+def render_time(s, resolution):
+    ''' Wall-clock time to build and draw the trajectory plot. '''
+    start = time.perf_counter()
+    f, ax = plot_trajectory(s, palette='inferno', resolution=resolution)
+    f.canvas.draw()
+    plt.close(f)
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    args = (10., 28., 8./3.)
+    render_time(np.random.random((3, 100)), 2000)   # compile the decimation functions
+    for T in [int(1e4), int(1e5), int(1e6)]:
+        times = np.linspace(0., 50., T)
+        s = calc_trajectories(lorenz, np.array([[1.,1.,1.]]), args, times, substeps=1)[0]
+        t_lod = render_time(s, 2000)
+        t_full = render_time(s, None) if T <= int(1e5) else np.nan
+        print('%8d points | full %7.2fs | level of detail %6.2fs' % (T, t_full, t_lod))
@@ -0,0 +1,325 @@
+import numpy as np
+import matplotlib.pyplot as plt
+import seaborn as sns
+from matplotlib.collections import LineCollection
+
+sns.set(font_scale=1.5, style='white')
+plt.rcParams['axes.linewidth'] = 1
+plt.rcParams['xtick.bottom'] = True
+plt.rcParams['ytick.left'] = True
+plt.rcParams['xtick.direction'] = 'in'
+plt.rcParams['ytick.direction'] = 'in'
+plt.rcParams['mathtext.default'] = 'regular'
+
+# L-systems from the notebook: axiom, rules, turn angle and length factor of each rewrite
+LSYSTEMS = {'koch': ('F', {'F':'F+F--F+F'}, 60, 1/3.),
+            'snowflake': ('F--F--F', {'F':'F+F--F+F'}, 60, 1/3.),
+            'crystal': ('F+F+F+F', {'F':'FF+F++F+F'}, 90, 1/3.),
+            'pentadendrite': ('F+F+F+F+F', {'F':'F+F+F--F-F+F'}, 72, 1/3.),
+            'dragon': ('F', {'F':'F-G', 'G':'F+G'}, 90, 1/np.sqrt(2)),
+            'sierpinski': ('F', {'F':'G-F-G', 'G':'F+G+F'}, 60, 1/2.),
+            'tree': ('F', {'F':'[+F]F[-F]F'}, 30, 1.),
+            'bourke_leaf': ('A', {'F':'F', 'A':'F[+X]FB', 'B':'F[-Y]FA', 'X':'A', 'Y':'B'}, 45, {'F':1.36})}
+
+# symbols that draw a line (variables), turn the turtle, or push/pop its state
+DRAW = np.array([chr(i).isalpha() for i in range(256)])
+LEFT, RIGHT, PUSH, POP = map(ord, '+-[]')
+
+def to_codes(symbols):
+    ''' Convert a string of symbols to an array of byte codes. '''
+    return np.frombuffer(symbols.encode('ascii'), dtype=np.uint8)
+
+def to_string(codes):
+    ''' Convert an array of byte codes back to a string of symbols. '''
+    return np.asarray(codes, dtype=np.uint8).tobytes().decode('ascii')
+
+def get_productions(rules, scale=1.):
+    ''' Build lookup tables for the production rules of an L-system.
+        Inputs:
+            rules - dictionary mapping each variable to its replacement string
+            scale - length factor applied when a variable is rewritten, either a number
+                    for all variables or a dictionary of factors per variable (default 1)
+        Outputs:
+            table - (256, n) array, row c holds the replacement codes of symbol c
+            size - (256,) array of replacement lengths (1 for constants)
+            factor - (256,) array of length factors
+    '''
+    n = max([1] + [len(r) for r in rules.values()])
+    table = np.zeros((256,n), dtype=np.uint8)
+    table[:,0] = np.arange(256) # symbols without a rule are copied
+    size = np.ones(256, dtype=np.int64)
+    factor = np.ones(256)
+    for s, r in rules.items():
+        c = ord(s)
+        table[c,:len(r)] = to_codes(r)
+        size[c] = len(r)
+        if isinstance(scale, dict):
+            factor[c] = scale.get(s, 1.)
+        else:
+            factor[c] = scale
+    return table, size, factor
+
+def rewrite(codes, lengths, table, size, factor):
+    ''' Apply the production rules once to a whole symbol stream. '''
+    n = size[codes]
+    offsets = np.cumsum(n) - n
+    idx = np.arange(n.sum()) - np.repeat(offsets, n)
+    return table[np.repeat(codes, n), idx], np.repeat(lengths*factor[codes], n)
+
+def expand(axiom, rules, depth, scale=1., length=1.):
+    ''' Expand an L-system iteratively, one generation at a time.
+        Inputs:
+            axiom - initiator string
+            rules - dictionary mapping each variable to its replacement string
+            depth - number of generations
+            scale - length factor of each rewrite (see get_productions)
+            length - segment length of the axiom symbols
+        Outputs:
+            codes - byte codes of the symbol stream after depth generations
+            lengths - segment length of each symbol
+    '''
+    table, size, factor = get_productions(rules, scale)
+    codes = to_codes(axiom)
+    lengths = np.full(len(codes), float(length))
+    for _ in range(depth):
+        codes, lengths = rewrite(codes, lengths, table, size, factor)
+    return codes, lengths
+
+def iter_expand(axiom, rules, depth, scale=1., length=1., chunk=2**16):
+    ''' Expand an L-system lazily, yielding the symbol stream in chunks of at most
+        chunk symbols (or one replacement string, if longer), so that huge depths
+        never have to be held in memory at once.
+        Inputs:
+            axiom, rules, depth, scale, length - as in expand
+            chunk - target number of symbols per chunk
+        Outputs:
+            generator of (codes, lengths) pairs in drawing order
+    '''
+    table, size, factor = get_productions(rules, scale)
+
+    # expanded length of each symbol after d generations (float, since it may overflow)
+    sizes = [np.ones(256)]
+    for _ in range(depth):
+        sizes.append(np.array([sizes[-1][table[c,:size[c]]].sum() for c in range(256)]))
+
+    def expand_chunks(codes, lengths, d):
+        cum = np.cumsum(sizes[d][codes])
+        start = 0
+        while start < len(codes):
+            end = np.searchsorted(cum, (cum[start-1] if start else 0) + chunk, side='right')
+            if end > start or d == 0:
+                end = max(end, start+1)
+                c, l = codes[start:end], lengths[start:end]
+                for _ in range(d):
+                    c, l = rewrite(c, l, table, size, factor)
+                yield c, l
+            else: # a single symbol too large for one chunk, descend one generation
+                end = start + 1
+                c, l = rewrite(codes[start:end], lengths[start:end], table, size, factor)
+                yield from expand_chunks(c, l, d-1)
+            start = end
+
+    codes = to_codes(axiom)
+    yield from expand_chunks(codes, np.full(len(codes), float(length)), depth)
+
+def match_brackets(codes, nstack=0):
+    ''' Pair up the push and pop symbols of a stream, level by level.
+        Inputs:
+            codes - byte codes of the symbol stream
+            nstack - number of states already on the branch stack
+        Outputs:
+            pairs - (opens, closes, levels) of the matched brackets
+            popped - (indices, levels) of pops that restore a state from the existing stack
+            pushed - indices of pushes left open at the end of the stream
+    '''
+    opens = codes == PUSH
+    closes = codes == POP
+    depth = np.cumsum(opens.astype(np.int64) - closes)
+    idx = np.flatnonzero(opens | closes)
+    level = depth[idx] + closes[idx] # depth just inside the brackets
+    order = np.lexsort((idx, level))
+    idx, level = idx[order], level[order]
+
+    # events on a level alternate push/pop; levels <= 0 start with a pop of an existing state
+    m = len(idx)
+    first = np.r_[True, level[1:] != level[:-1]] if m else np.zeros(0, dtype=bool)
+    rank = np.arange(m) - np.maximum.accumulate(np.where(first, np.arange(m), 0)) - (level <= 0)
+    has_next = np.r_[~first[1:], False] if m else first
+    is_pair = (rank % 2 == 0) & has_next
+    pairs = (idx[is_pair], idx[np.flatnonzero(is_pair)+1], level[is_pair])
+
+    pop_stack = rank == -1
+    if np.sum(pop_stack) > nstack:
+        raise ValueError('unbalanced brackets: more pops than pushes')
+    order = np.argsort(idx[pop_stack])
+    popped = (idx[pop_stack][order], level[pop_stack][order])
+    pushed = np.sort(idx[(rank % 2 == 0) & ~has_next])
+    return pairs, popped, pushed
+
+def branch_cumsum(x, x0, pairs, popped, targets):
+    ''' Cumulative sum of x that is reset at every pop to its value at the matching push.
+        Inputs:
+            x - increments of each symbol (zero at the brackets)
+            x0 - initial value
+            pairs, popped - bracket structure from match_brackets
+            targets - values restored by the popped states
+        Outputs:
+            cumulative sum after each symbol
+    '''
+    x = x.copy()
+    opens, closes, levels = pairs
+    # innermost branches first, so each pop also undoes its nested branches
+    for level in np.unique(levels)[::-1]:
+        s = levels == level
+        c = np.cumsum(x)
+        x[closes[s]] = c[opens[s]] - c[closes[s]]
+    c = x0 + np.cumsum(x)
+    offset = 0
+    for i, target in zip(popped[0], targets):
+        x[i] = target - (c[i] + offset)
+        offset += x[i]
+    return x0 + np.cumsum(x)
+
+def trace(codes, lengths, angle, position=(0,0), heading=0, stack=None):
+    ''' Interpret a symbol stream with turtle graphics, without drawing one line at a time.
+        The turtle follows the ColabTurtle conventions: headings in degrees, clockwise
+        from due East, with y pointing down. Variables draw forward, + turns left and
+        - turns right by angle, [ pushes and ] pops the position and heading.
+        Inputs:
+            codes - byte codes of the symbol stream
+            lengths - segment length of each symbol
+            angle - rotation angle in degrees
+            position - (x, y) position of the turtle
+            heading - heading of the turtle in degrees
+            stack - list of (x, y, heading) states, updated in place for streams
+                    that are traced in chunks (default None)
+        Outputs:
+            segments - (M, 2, 2) array of line segments [[x0, y0], [x1, y1]]
+            headings - (M,) array of the heading after each segment
+            state - (position, heading) of the turtle at the end of the stream
+    '''
+    if stack is None:
+        stack = []
+    codes = np.asarray(codes)
+    pairs, popped, pushed = match_brackets(codes, len(stack))
+    restored = [stack[level-1] for level in popped[1]] # level 0 pops the top of the stack
+
+    turns = np.zeros(len(codes))
+    turns[codes == LEFT] = -angle
+    turns[codes == RIGHT] = angle
+    h = branch_cumsum(turns, heading, pairs, popped, [s[2] for s in restored])
+
+    # vectorized cumulative sum of the steps, positions as complex numbers
+    draw = DRAW[codes]
+    steps = np.where(draw, lengths*np.exp(1j*np.radians(h)), 0)
+    z0 = complex(*position)
+    z = branch_cumsum(steps, z0, pairs, popped, [complex(s[0], s[1]) for s in restored])
+    start = np.r_[z0, z[:-1]][draw]
+    end = z[draw]
+    segments = np.stack([np.stack([start.real, start.imag], axis=1),
+                         np.stack([end.real, end.imag], axis=1)], axis=1)
+
+    # update the branch stack
+    del stack[len(stack)-len(popped[0]):]
+    stack.extend([(z[i].real, z[i].imag, h[i]) for i in pushed])
+    if len(codes):
+        position, heading = (z[-1].real, z[-1].imag), h[-1]
+    return segments, np.mod(h[draw], 360), (position, heading)
+
+def make_lsystem(axiom, rules, depth, angle, length, position=(0,0), heading=0, scale=1.):
+    ''' Generate the geometry of an L-system.
+        Inputs:
+            axiom, rules, depth, scale - as in expand
+            angle - rotation angle in degrees
+            length - segment length of the axiom symbols
+            position - initial (x, y) position of the turtle
+            heading - initial heading of the turtle in degrees
+        Outputs:
+            segments - (M, 2, 2) array of line segments
+            symbols - (M,) array of the symbol drawing each segment
+            headings - list of headings, starting with the initial heading (as make_fractal)
+    '''
+    codes, lengths = expand(axiom, rules, depth, scale, length)
+    segments, h, _ = trace(codes, lengths, angle, position, heading)
+    return segments, codes[DRAW[codes]], [heading] + list(h)
+
+def iter_lsystem(axiom, rules, depth, angle, length, position=(0,0), heading=0, scale=1., chunk=2**16):
+    ''' Generate the geometry of an L-system lazily, for depths too large to hold in memory.
+        Inputs:
+            as in make_lsystem, plus
+            chunk - target number of symbols per chunk
+        Outputs:
+            generator of (segments, symbols, headings) chunks, without the initial heading
+    '''
+    state = (position, heading)
+    stack = []
+    for codes, lengths in iter_expand(axiom, rules, depth, scale, length, chunk):
+        segments, h, state = trace(codes, lengths, angle, *state, stack)
+        yield segments, codes[DRAW[codes]], h
+
+def headings2steps(headings, base_rotation):
+    ''' Convert a list of headings to steps up or down a scale, as in the notebook.
+        Inputs:
+            headings - list of headings in degrees
+            base_rotation - rotation in degrees corresponding to one step
+        Outputs:
+            steps - steps relative to the starting pitch
+    '''
+    diff = np.diff(np.array(headings, dtype=int))
+    diff -= 360*np.round(diff/360).astype(int) # pick smallest absolute angle
+    return np.cumsum(diff / base_rotation).astype(int)
+
+def get_segment_colors(symbols, colors):
+    ''' Look up a color for each segment from a dictionary of colors per symbol. '''
+    return [colors.get(chr(s), 'k') for s in symbols]
+
+def plot_lsystem(segments, symbols=None, colors='olivedrab', lw=1, size=(600,400), bgcolor='linen', ax=None):
+    ''' Plot the segments of an L-system in turtle (screen) coordinates.
+        Inputs:
+            segments - (M, 2, 2) array of line segments
+            symbols - (M,) array of the symbol drawing each segment (default None)
+            colors - color of all segments, or dictionary of colors per symbol
+            lw - linewidth
+            size - (W, H) window size, or None to fit the segments
+            bgcolor - background color
+            ax - axis to plot on (default None, creates a new figure)
+        Outputs:
+            f, ax - figure and axis objects of resulting plot
+    '''
+    if ax is None:
+        f = plt.figure(figsize=(9,6))
+        ax = f.add_subplot()
+    f = ax.figure
+    if isinstance(colors, dict):
+        colors = get_segment_colors(symbols, colors)
+    ax.add_collection(LineCollection(segments, colors=colors, linewidths=lw, capstyle='round'))
+    if size is None:
+        ax.autoscale()
+    else:
+        ax.set_xlim(0, size[0])
+        ax.set_ylim(0, size[1])
+    ax.invert_yaxis() # y points down on the turtle screen
+    ax.set_aspect('equal')
+    ax.set_facecolor(bgcolor)
+    ax.set_xticks([])
+    ax.set_yticks([])
+    return f, ax
+
+def write_svg(filename, segments, symbols=None, colors='olivedrab', lw=3, size=(600,400), bgcolor='linen'):
+    ''' Export the segments of an L-system to an SVG file, as drawn by the turtle.
+        Inputs:
+            filename - name of the SVG file
+            segments - (M, 2, 2) array of line segments
+            symbols, colors, lw, size, bgcolor - as in plot_lsystem
+    '''
+    if isinstance(colors, dict):
+        colors = get_segment_colors(symbols, colors)
+    else:
+        colors = [colors]*len(segments)
+    with open(filename, 'w') as f:
+        f.write('<svg width="%d" height="%d" xmlns="http://www.w3.org/2000/svg">\n' % size)
+        f.write('<rect width="100%%" height="100%%" fill="%s"/>\n' % bgcolor)
+        f.write('<g stroke-width="%g" stroke-linecap="round">\n' % lw)
+        for ((x0, y0), (x1, y1)), c in zip(segments, colors):
+            f.write('<line x1="%.3f" y1="%.3f" x2="%.3f" y2="%.3f" stroke="%s"/>\n' % (x0, y0, x1, y1, c))
+        f.write('</g>\n</svg>\n')
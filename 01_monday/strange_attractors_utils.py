@@ -1,10 +1,13 @@
 import numpy as np
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 import seaborn as sns
 from matplotlib.colors import ListedColormap
 from mpl_toolkits.mplot3d import Axes3D
 from mpl_toolkits.mplot3d.art3d import Line3DCollection
+from numba import njit, prange, get_num_threads, set_num_threads
 
 sns.set(font_scale=1.5, style='white')
 plt.rcParams['axes.linewidth'] = 1
@@ -73,17 +76,91 @@ def get_segments3d(s):
     segments = np.concatenate([points[:-1], points[1:]], axis=1)
     return segments
 
-def colorline3d(s, palette='CMRmap'):
+@njit
+def radial_filter(s, tol):
+    ''' Indices of the points that lie at least tol away from the previously kept point
+        (the first and last points are always kept).
+    '''
+    N = s.shape[1]
+    keep = np.zeros(N, dtype=np.int64)
+    n = 1
+    last = 0
+    for i in range(1, N-1):
+        d = (s[0,i] - s[0,last])**2 + (s[1,i] - s[1,last])**2 + (s[2,i] - s[2,last])**2
+        if d >= tol*tol:
+            keep[n] = i
+            last = i
+            n += 1
+    keep[n] = N-1
+    return keep[:n+1]
+
+@njit
+def douglas_peucker(s, idx, tol):
+    ''' Subset of the indices idx of the polyline s whose simplified path stays within
+        tol of every point of idx (Ramer-Douglas-Peucker, with an explicit stack, measuring
+        the distance to each segment rather than to the line through its end points).
+    '''
+    n = len(idx)
+    keep = np.zeros(n, dtype=np.bool_)
+    keep[0] = keep[-1] = True
+    stack = [(0, n-1)]
+    while len(stack) > 0:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        i, j = idx[a], idx[b]
+        ux, uy, uz = s[0,j] - s[0,i], s[1,j] - s[1,i], s[2,j] - s[2,i]
+        uu = ux*ux + uy*uy + uz*uz
+        dmax, imax = -1., a
+        for k in range(a+1, b):
+            wx, wy, wz = s[0,idx[k]] - s[0,i], s[1,idx[k]] - s[1,i], s[2,idx[k]] - s[2,i]
+            # squared distance from the closest point of the segment
+            t = min(max((wx*ux + wy*uy + wz*uz)/uu, 0.), 1.) if uu > 0 else 0.
+            wx, wy, wz = wx - t*ux, wy - t*uy, wz - t*uz
+            d = wx*wx + wy*wy + wz*wz
+            if d > dmax:
+                dmax, imax = d, k
+        if dmax > tol*tol:
+            keep[imax] = True
+            stack.append((a, imax))
+            stack.append((imax, b))
+    return idx[keep]
+
+def simplify_trajectory(s, resolution=2000, tol=None):
+    ''' Level-of-detail decimation of a 3d trajectory: drop the points that would not
+        change the drawn path by more than tol, i.e. about a pixel at the given resolution.
+        Inputs:
+          s - array storing 3d-coordinates of the full trajectory
+          resolution - number of pixels across the plot (sets tol when tol is None)
+          tol - maximum distance between the simplified and the full path
+        Outputs:
+          idx - sorted indices of the points to keep
+    '''
+    s = np.ascontiguousarray(s, dtype=np.float64)
+    if tol is None:
+        tol = np.linalg.norm(s.max(axis=1) - s.min(axis=1))/resolution
+    idx = radial_filter(s, 0.5*tol)
+    return douglas_peucker(s, idx, 0.5*tol)
+
+def colorline3d(s, palette='CMRmap', resolution=None):
     ''' Create a color gradient along a trajectory.
         Inputs:
           s - array storing 3d-coordinates of the full trajectory
           palette - colormap name
+          resolution - if given, simplify the trajectory to about this many pixels
+                       across (see simplify_trajectory); colors still follow the
+                       position of each point along the full trajectory
         Outputs:
           lc - line collection object for plotting
     '''
     N = s.shape[1]
-    segments = get_segments3d(s)
-    lc = Line3DCollection(segments, array=np.linspace(0,1,N), cmap=palette)
+    if resolution is None:
+        segments = get_segments3d(s)
+        lc = Line3DCollection(segments, array=np.linspace(0,1,N), cmap=palette)
+        return lc
+    idx = simplify_trajectory(s, resolution)
+    segments = get_segments3d(s[:,idx])
+    lc = Line3DCollection(segments, array=idx[:-1]/(N-1), cmap=palette)
     return lc
 
 def set_limits3d(ax, s):
@@ -96,11 +173,12 @@ def set_limits3d(ax, s):
     ax.set_ylim([s[1,:].min(), s[1,:].max()])
     ax.set_zlim([s[2,:].min(), s[2,:].max()])
 
-def plot_trajectory(s, palette='CMRmap'):
+def plot_trajectory(s, palette='CMRmap', resolution=None):
     ''' Plot the trajectory s.
         Inputs:
           s - array storing 3d-coordinates of the full trajectory
           palette - colormap name
+          resolution - level of detail passed to colorline3d (default None draws every point)
         Outputs:
           f, ax - figure and axis objects of resulting plot
     '''
@@ -113,14 +191,15 @@ def plot_trajectory(s, palette='CMRmap'):
     ax.set_zlabel('z')
 
     # plot trajectory
-    ax.add_collection3d(colorline3d(s, palette))
+    ax.add_collection3d(colorline3d(s, palette, resolution))
     return f, ax
 
-def animate_trajectory(S, palette='rainbow'):
+def animate_trajectory(S, palette='rainbow', resolution=None):
     ''' Create a movie of the trajectory s.
         Inputs:
           S - list of arrays storing 3d-coordinates of the full trajectory
           palette - colormap name
+          resolution - level of detail of the drawn paths (default None draws every point)
         Outputs:
           ani - animation
     '''
@@ -143,12 +222,29 @@ def animate_trajectory(S, palette='rainbow'):
             m.set_data([], [])
         return lines + markers
 
+    # simplify each path once; every frame then draws a view of the kept points before
+    # the current time, followed by the current point, which is written in place of the
+    # next kept point (and restored in the following frame)
+    if resolution is None:
+        kept = [np.arange(s.shape[1]) for s in S]
+    else:
+        kept = [simplify_trajectory(s, resolution) for s in S]
+    paths = [np.hstack([s[:,k], s[:,-1:]]) for s, k in zip(S, kept)]
+    ends = [0]*len(S)
+
     # animation
     spf = 2             # time steps per frame
     def animate(i):
         i = (spf*i)%S[0].shape[1]
-        for l, m, s in zip(lines, markers, S):
-            x, y, z = s[:,:i]
+        for j, (l, m, s, k, p) in enumerate(zip(lines, markers, S, kept, paths)):
+            e = ends[j]
+            p[:,e] = s[:,k[e]] if e < len(k) else s[:,-1]
+            n = np.searchsorted(k, i)
+            if i > 0:
+                p[:,n] = s[:,i-1]
+                ends[j] = n
+                n += 1
+            x, y, z = p[:,:n]
             l.set_data(x, y)
             l.set_3d_properties(z)
             m.set_data(x[-1:], y[-1:])
@@ -160,3 +256,265 @@ def animate_trajectory(S, palette='rainbow'):
     ani = animation.FuncAnimation(f, animate, init_func=init, frames=S[0].shape[1]//spf, interval=30, blit=True)
     plt.close(f)
     return ani
+
+@njit
+def get_bounds(fmap, s0, args, N, warmup=2000):
+    ''' Run a short pilot orbit and return its bounding box.
+        Inputs:
+            fmap - function of the iterative map
+            s0 - initial value
+            args - additional arguments taken by fmap
+            N - number of iterations of the pilot run
+            warmup - number of transient iterations
+        Outputs:
+            bounds - array [xmin, xmax, ymin, ymax]
+    '''
+    s = s0
+    for i in range(warmup):
+        s = fmap(s, args)
+    bounds = np.array([s[0], s[0], s[1], s[1]])
+    for i in range(N):
+        s = fmap(s, args)
+        bounds[0] = min(bounds[0], s[0]); bounds[1] = max(bounds[1], s[0])
+        bounds[2] = min(bounds[2], s[1]); bounds[3] = max(bounds[3], s[1])
+    return bounds
+
+@njit(parallel=True)
+def accumulate_counts(counts, fmap, s0, args, N, bounds, warmup=2000):
+    ''' Iterate the map from each initial condition in parallel, adding every visit
+        straight into a count grid; the orbit is never stored. Orbit k is added to grid
+        k % len(counts), so one grid per thread is enough.
+        Inputs:
+            counts - (ngrids, nx, ny) integer array of visit counts
+            fmap - function of the iterative map
+            s0 - (k, 2) array of initial values
+            args - additional arguments taken by fmap
+            N - number of iterations per initial value
+            bounds - [xmin, xmax, ymin, ymax] of the image domain; points outside are skipped
+            warmup - number of transient iterations
+    '''
+    ngrids, nx, ny = counts.shape
+    xmin, xmax, ymin, ymax = bounds
+    sx = (nx-1)/(xmax - xmin)
+    sy = (ny-1)/(ymax - ymin)
+    for g in prange(ngrids):
+        for k in range(g, len(s0), ngrids):
+            s = s0[k]
+            for i in range(warmup):
+                s = fmap(s, args)
+            for i in range(N):
+                s = fmap(s, args)
+                x, y = s[0], s[1]
+                if x >= xmin and x <= xmax and y >= ymin and y <= ymax:
+                    counts[g, int((x - xmin)*sx), int((y - ymin)*sy)] += 1
+
+def make_attractor_streaming(image, fmap, s0, args, N, warmup=2000, seeds=None, pilot=100000, margin=0.01):
+    ''' Memory-light version of make_attractor: visits are accumulated into one count grid
+        per thread as the orbits are computed, so memory use is O(threads x image)
+        regardless of N and of the number of seeds.
+        Inputs:
+            image - output image, filled with log2(1 + visit counts) as in make_attractor
+            fmap - function of the iterative map
+            s0 - initial value
+            args - additional arguments taken by fmap
+            N - total number of iterations, split evenly between the seeds
+            warmup - number of transient iterations
+            seeds - number of orbits to run in parallel, started near s0 (default: number of cores)
+            pilot - number of iterations of the pilot run used to find the image bounds
+            margin - fraction of the pilot bounding box added on each side
+        Outputs:
+            counts - (nx, ny) array of raw visit counts
+    '''
+    seeds = get_num_threads() if seeds is None else seeds
+
+    # find the image domain from a short pilot run
+    s0 = np.asarray(s0, dtype=float)
+    bounds = get_bounds(fmap, s0, args, min(pilot, N), warmup)
+    dx, dy = margin*(bounds[1] - bounds[0]), margin*(bounds[3] - bounds[2])
+    bounds += np.array([-dx, dx, -dy, dy])
+
+    # start the other orbits from small random perturbations of s0
+    rng = np.random.default_rng(0)
+    s0 = np.tile(s0, (seeds, 1))
+    s0[1:] += 1e-6*rng.standard_normal((seeds-1, s0.shape[1]))
+
+    # accumulate and sum the count grids of all threads
+    counts = np.zeros((min(seeds, get_num_threads()),) + image.shape, dtype=np.int64)
+    accumulate_counts(counts, fmap, s0, args, -(-N//seeds), bounds, warmup)
+    counts = counts.sum(axis=0)
+
+    # apply log scaling only at the end
+    image[:] = np.log2(1 + counts)
+    return counts
+
+@njit(parallel=True)
+def screen_parameters(fmap, s0, params, N=2000, warmup=500, grid=32, eps=1e-8, R=1e6):
+    ''' Estimate from a short orbit how chaotic and how space-filling the attractor of
+        each parameter set is. The largest Lyapunov exponent is measured by following a
+        nearby orbit and renormalizing its separation after every step.
+        Inputs:
+            fmap - function of the iterative map
+            s0 - initial value
+            params - (M, nargs) array of candidate parameter sets
+            N - number of iterations per candidate
+            warmup - number of transient iterations
+            grid - resolution of the grid used to measure the fill fraction
+            eps - separation of the nearby orbit
+            R - orbits leaving the disk of radius R are considered unbounded
+        Outputs:
+            lyap - largest Lyapunov exponent of each candidate (nan if unbounded)
+            fill - fraction of grid cells visited within the orbit's bounding box
+    '''
+    M = len(params)
+    lyap = np.full(M, np.nan)
+    fill = np.zeros(M)
+    for k in prange(M):
+        args = params[k]
+        s = s0.copy()
+        bounded = True
+        for i in range(warmup):
+            s = fmap(s, args)
+            if not (np.abs(s[0]) < R and np.abs(s[1]) < R):
+                bounded = False
+                break
+        if not bounded:
+            continue
+
+        # iterate the orbit alongside a nearby one
+        orbit = np.zeros((N, 2))
+        t = s + np.array([eps, 0.])
+        total = 0.
+        for i in range(N):
+            s = fmap(s, args)
+            t = fmap(t, args)
+            if not (np.abs(s[0]) < R and np.abs(s[1]) < R):
+                bounded = False
+                break
+            orbit[i] = s
+            d = np.sqrt((t[0] - s[0])**2 + (t[1] - s[1])**2)
+            if d == 0.:
+                d = 1e-300
+            total += np.log(d/eps)
+            t = s + (t - s)*(eps/d)
+        if not bounded:
+            continue
+        lyap[k] = total/N
+
+        # count the visited cells of a coarse grid over the bounding box
+        xmin, xmax = orbit[:,0].min(), orbit[:,0].max()
+        ymin, ymax = orbit[:,1].min(), orbit[:,1].max()
+        if xmax - xmin < 1e-10 or ymax - ymin < 1e-10:
+            continue
+        visited = np.zeros((grid, grid), dtype=np.bool_)
+        for i in range(N):
+            visited[int((orbit[i,0] - xmin)/(xmax - xmin)*(grid-1)),
+                    int((orbit[i,1] - ymin)/(ymax - ymin)*(grid-1))] = True
+        fill[k] = visited.sum()/grid**2
+    return lyap, fill
+
+def random_parameters(M, nargs=4, low=-3., high=3., seed=None):
+    ''' Draw M candidate parameter sets uniformly from [low, high]^nargs. '''
+    rng = np.random.default_rng(seed)
+    return rng.uniform(low, high, size=(M, nargs))
+
+def search_attractors(fmap, s0, params, min_lyap=0.01, min_fill=0.05, **kwargs):
+    ''' Keep only the chaotic, bounded and space-filling candidates, best first.
+        Inputs:
+            fmap - function of the iterative map
+            s0 - initial value
+            params - (M, nargs) array of candidate parameter sets
+            min_lyap - smallest Lyapunov exponent considered chaotic
+            min_fill - smallest fill fraction considered visually rich
+            kwargs - additional arguments passed to screen_parameters
+        Outputs:
+            params, lyap, fill - surviving parameter sets and their metrics,
+                                 ranked by decreasing fill fraction
+    '''
+    params = np.asarray(params, dtype=float)
+    lyap, fill = screen_parameters(fmap, np.asarray(s0, dtype=float), params, **kwargs)
+    keep = np.nonzero((lyap > min_lyap) & (fill > min_fill))[0]
+    keep = keep[np.argsort(-fill[keep], kind='stable')]
+    return params[keep], lyap[keep], fill[keep]
+
+def _preview(args):
+    fmap, s0, params, shape, N = args
+    image = np.zeros(shape)
+    make_attractor_streaming(image, fmap, s0, tuple(params), N, seeds=1)
+    return image
+
+def render_previews(fmap, s0, params, shape=(200,200), N=int(1e6), workers=None):
+    ''' Render small preview images of many parameter sets in a process pool.
+        Inputs:
+            fmap - function of the iterative map
+            s0 - initial value
+            params - (M, nargs) array of parameter sets
+            shape - (nx, ny) size of each preview
+            N - number of iterations per preview
+            workers - number of worker processes (default: number of cores)
+        Outputs:
+            images - (M, nx, ny) array of preview images
+    '''
+    jobs = [(fmap, np.asarray(s0, dtype=float), p, shape, N) for p in params]
+    with ProcessPoolExecutor(workers, mp_context=mp.get_context('spawn'),
+                             initializer=set_num_threads, initargs=(1,)) as pool:
+        images = list(pool.map(_preview, jobs))
+    return np.array(images).reshape((len(jobs),) + tuple(shape))
+
+@njit(parallel=True)
+def _rk4_ensemble(out, fode, s0, args, times, substeps):
+    ''' Compiled kernel of calc_trajectories; each trajectory is integrated independently. '''
+    for m in prange(len(s0)):
+        s = s0[m].astype(np.float64)
+        out[m,:,0] = s
+        for i in range(len(times)-1):
+            h = (times[i+1] - times[i])/substeps
+            t = times[i]
+            for k in range(substeps):
+                k1 = fode(t, s, args)
+                k2 = fode(t + 0.5*h, s + 0.5*h*k1, args)
+                k3 = fode(t + 0.5*h, s + 0.5*h*k2, args)
+                k4 = fode(t + h, s + h*k3, args)
+                s = s + h/6.*(k1 + 2*k2 + 2*k3 + k4)
+                t += h
+            out[m,:,i+1] = s
+
+def calc_trajectories(fode, s0, args, times, substeps=10, dtype=np.float64, compiled=False):
+    ''' Solve an ordinary differential equation for a whole ensemble of initial conditions
+        with the fixed-step classical Runge-Kutta (RK4) method.
+        Inputs:
+            fode - function of the ordinary differential equation to solve
+            s0 - (M, d) array of initial conditions
+            args - additional arguments taken by fode
+            times - array of time points at which to solve
+            substeps - number of RK4 steps between consecutive time points
+            dtype - data type of the output (e.g. np.float32 to halve memory)
+            compiled - if False, step the whole ensemble at once with numpy, calling
+                       fode on a (d, M) state array; if True, integrate each trajectory
+                       in parallel with numba instead (fode must be njit-compiled)
+        Outputs:
+            out - (M, d, len(times)) array of solutions at the specified time points
+    '''
+    s0 = np.atleast_2d(np.asarray(s0, dtype=np.float64))
+    times = np.asarray(times, dtype=np.float64)
+    M, d = s0.shape
+    out = np.zeros((M, d, len(times)), dtype=dtype)
+    if compiled:
+        _rk4_ensemble(out, fode, s0, args, times, substeps)
+        return out
+
+    # vectorized over the ensemble: the state is stored as a (d, M) array
+    f = getattr(fode, 'py_func', fode)
+    s = s0.T.copy()
+    out[:,:,0] = s0
+    for i in range(len(times)-1):
+        h = (times[i+1] - times[i])/substeps
+        t = times[i]
+        for k in range(substeps):
+            k1 = f(t, s, args)
+            k2 = f(t + 0.5*h, s + 0.5*h*k1, args)
+            k3 = f(t + 0.5*h, s + 0.5*h*k2, args)
+            k4 = f(t + h, s + h*k3, args)
+            s = s + h/6.*(k1 + 2*k2 + 2*k3 + k4)
+            t += h
+        out[:,:,i+1] = s.T
+    return out
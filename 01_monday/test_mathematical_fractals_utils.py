@@ -0,0 +1,32 @@
+''' Regression tests for the perturbation (deep-zoom) renderer.
+
+    Run from this folder with:
+        python -m pytest test_mathematical_fractals_utils.py
+'''
+import numpy as np
+import pytest
+from numba import njit
+
+from mathematical_fractals_utils import make_fractal_parallel, make_fractal_deep, \
+                                        julia_cycle, quadratic_mandel
+
+# map as defined in the notebook
+@njit
+def quadratic(z, c):
+    return z**2 + c
+
+@pytest.mark.parametrize('mandel, p, L, origin', [
+    (False, complex(-0.8, 0.156), 1e-3, (0., 0.)),   # Julia set centered on the critical point
+    (False, complex(-0.4, 0.6), 1.5, (0., 0.)),
+    (False, complex(-0.8, 0.156), 1e-5, (0.3, 0.1)),
+    (True, complex(0., 0.), 1.5, (-0.5, 0.)),
+    (True, complex(0., 0.), 1e-3, (-0.7435, 0.1314)),
+])
+def test_deep_matches_direct(mandel, p, L, origin):
+    # at moderate extents, the series skip must not change any escape count
+    deep = np.zeros((100, 100), dtype=np.int64)
+    direct = np.zeros((100, 100), dtype=np.int64)
+    make_fractal_deep(deep, L, p, R=50, max_iters=255, origin=origin, mandel=mandel)
+    fset = quadratic_mandel if mandel else julia_cycle
+    make_fractal_parallel(direct, fset, quadratic, L, p, R=50, max_iters=255, origin=origin)
+    assert np.mean(deep != direct) < 1e-3
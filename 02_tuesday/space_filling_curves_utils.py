@@ -0,0 +1,443 @@
+import numpy as np
+from numba import njit, prange
+
+@njit
+def get_bounds(pts):
+    ''' Return the minimum and maximum of the points along each axis. '''
+    lo = pts[0].copy()
+    hi = pts[0].copy()
+    for k in range(1, len(pts)):
+        for i in range(pts.shape[1]):
+            lo[i] = min(lo[i], pts[k,i])
+            hi[i] = max(hi[i], pts[k,i])
+    return lo, hi
+
+@njit(parallel=True)
+def _quantize(coords, pts, lo, scale, n):
+    for k in prange(len(pts)):
+        for i in range(pts.shape[1]):
+            coords[k,i] = min(int((pts[k,i] - lo[i])*scale[i]), n-1)
+
+def quantize(pts, lv=12):
+    ''' Rescale points to the integer grid of a space-filling curve.
+        Inputs:
+            pts - (N, d) array of points
+            lv - number of levels, the grid has 2^lv cells along each axis
+        Outputs:
+            coords - (N, d) int64 array of grid coordinates on [0, 2^lv-1]
+    '''
+    pts = np.ascontiguousarray(pts, dtype=np.float64)
+    lo, hi = get_bounds(pts)
+    n = 1 << lv
+    coords = np.empty(pts.shape, dtype=np.int64)
+    _quantize(coords, pts, lo, n/np.where(hi > lo, hi - lo, 1), n)
+    return coords
+
+def get_hilbert_tables(k=4):
+    ''' Build lookup tables that advance the 2D Hilbert curve by k levels at once.
+        The orientation of the curve in each quadrant is one of four states, combining a
+        reflection about y=x (bit 0) and y=-x (bit 1).
+        Inputs:
+            k - number of levels per lookup
+        Outputs:
+            encode - (4*4^k,) table from state and k bits of x and y to k digits and next state
+            decode - (4*4^k,) table from state and k digits to k bits of x and y and next state
+    '''
+    encode = np.zeros(4 << 2*k, dtype=np.int64)
+    decode = np.zeros(4 << 2*k, dtype=np.int64)
+    for state in range(4):
+        for xb in range(1 << k):
+            for yb in range(1 << k):
+                s = state
+                d = 0
+                for j in range(k-1, -1, -1):
+                    rx = (xb >> j) & 1
+                    ry = (yb >> j) & 1
+                    if s & 2: # reflect the point into the frame of the current quadrant
+                        rx, ry = 1-rx, 1-ry
+                    if s & 1:
+                        rx, ry = ry, rx
+                    d = (d << 2) | ((3*rx) ^ ry)
+                    if ry == 0: # the lower two quadrants are reflected
+                        s ^= 1 | (2*rx)
+                encode[(state << 2*k) | (xb << k) | yb] = (d << 2) | s
+                decode[(state << 2*k) | d] = (((xb << k) | yb) << 2) | s
+    return encode, decode
+
+HILBERT_LEVELS = 4
+HILBERT_ENCODE, HILBERT_DECODE = get_hilbert_tables(HILBERT_LEVELS)
+
+@njit(parallel=True)
+def _hilbert_encode(keys, coords, lv, table, k):
+    mask = (1 << k) - 1
+    pad = -lv % k # extra levels at the bottom, so lv is a multiple of k
+    for n in prange(len(coords)):
+        x = coords[n,0] << pad
+        y = coords[n,1] << pad
+        s = 0
+        d = 0
+        for j in range(lv + pad - k, -1, -k):
+            e = table[(s << 2*k) | (((x >> j) & mask) << k) | ((y >> j) & mask)]
+            d = (d << 2*k) | (e >> 2)
+            s = e & 3
+        keys[n] = d >> 2*pad
+
+@njit(parallel=True)
+def _hilbert_decode(coords, keys, lv, table, k):
+    mask = (1 << k) - 1
+    pad = -lv % k
+    for n in prange(len(keys)):
+        d = keys[n] << 2*pad
+        s = 0
+        x = 0
+        y = 0
+        for j in range(lv + pad - k, -1, -k):
+            e = table[(s << 2*k) | ((d >> 2*j) & ((1 << 2*k) - 1))]
+            x = (x << k) | ((e >> (k+2)) & mask)
+            y = (y << k) | ((e >> 2) & mask)
+            s = e & 3
+        coords[n,0] = x >> pad
+        coords[n,1] = y >> pad
+
+def hilbert_encode(coords, lv=12):
+    ''' Compute the 2D Hilbert curve index of each grid coordinate, k levels at a time. The
+        curve has the same orientation as coord2index: quadrants (0,0), (0,1), (1,1), (1,0),
+        with the lower two reflected about y=x and y=-x respectively.
+        Inputs:
+            coords - (N, 2) int64 array of grid coordinates on [0, 2^lv-1], lv <= 31
+            lv - number of levels
+        Outputs:
+            keys - (N,) int64 array of indices on [0, 4^lv-1]
+    '''
+    keys = np.empty(len(coords), dtype=np.int64)
+    _hilbert_encode(keys, np.asarray(coords, dtype=np.int64), lv, HILBERT_ENCODE, HILBERT_LEVELS)
+    return keys
+
+def hilbert_decode(keys, lv=12):
+    ''' Compute the grid coordinates of 2D Hilbert curve indices (inverse of hilbert_encode).
+        Inputs:
+            keys - (N,) int64 array of indices on [0, 4^lv-1]
+            lv - number of levels
+        Outputs:
+            coords - (N, 2) int64 array of grid coordinates
+    '''
+    coords = np.empty((len(keys),2), dtype=np.int64)
+    _hilbert_decode(coords, np.asarray(keys, dtype=np.int64), lv, HILBERT_DECODE, HILBERT_LEVELS)
+    return coords
+
+@njit
+def _skilling_step(x0, xi, Q):
+    # exchange or invert the low bits of x0 and xi, without branches
+    P = Q - 1
+    m = -((xi & Q) > 0) # all ones if the bit is set
+    t = (x0 ^ xi) & P & ~m
+    return x0 ^ (P & m) ^ t, xi ^ t
+
+@njit(parallel=True)
+def hilbert_encode3d(coords, lv=12):
+    ''' Compute the 3D Hilbert curve index of each grid coordinate, using Skilling's
+        transpose algorithm (Skilling, AIP Conf. Proc. 707, 381 (2004)).
+        Inputs:
+            coords - (N, 3) int64 array of grid coordinates on [0, 2^lv-1], lv <= 21
+            lv - number of levels
+        Outputs:
+            keys - (N,) int64 array of indices on [0, 8^lv-1]
+    '''
+    N = len(coords)
+    keys = np.zeros(N, dtype=np.int64)
+    for n in prange(N):
+        x0 = coords[n,0]
+        x1 = coords[n,1]
+        x2 = coords[n,2]
+        # inverse undo
+        Q = 1 << (lv-1)
+        while Q > 1:
+            x0, _ = _skilling_step(x0, x0, Q)
+            x0, x1 = _skilling_step(x0, x1, Q)
+            x0, x2 = _skilling_step(x0, x2, Q)
+            Q >>= 1
+        # Gray encode
+        x1 ^= x0
+        x2 ^= x1
+        t = 0
+        Q = 1 << (lv-1)
+        while Q > 1:
+            t ^= (Q - 1) & -((x2 & Q) > 0)
+            Q >>= 1
+        # interleave the bits of the transposed index
+        keys[n] = (_spread3(x0 ^ t) << 2) | (_spread3(x1 ^ t) << 1) | _spread3(x2 ^ t)
+    return keys
+
+@njit(parallel=True)
+def hilbert_decode3d(keys, lv=12):
+    ''' Compute the grid coordinates of 3D Hilbert curve indices (inverse of hilbert_encode3d).
+        Inputs:
+            keys - (N,) int64 array of indices on [0, 8^lv-1]
+            lv - number of levels
+        Outputs:
+            coords - (N, 3) int64 array of grid coordinates
+    '''
+    N = len(keys)
+    coords = np.zeros((N,3), dtype=np.int64)
+    for n in prange(N):
+        # transpose the index
+        d = keys[n]
+        x0 = _compact3(d >> 2)
+        x1 = _compact3(d >> 1)
+        x2 = _compact3(d)
+        # Gray decode
+        t = x2 >> 1
+        x2 ^= x1
+        x1 ^= x0
+        x0 ^= t
+        # undo excess work
+        Q = 2
+        while Q != (1 << lv):
+            x0, x2 = _skilling_step(x0, x2, Q)
+            x0, x1 = _skilling_step(x0, x1, Q)
+            x0, _ = _skilling_step(x0, x0, Q)
+            Q <<= 1
+        coords[n,0] = x0
+        coords[n,1] = x1
+        coords[n,2] = x2
+    return coords
+
+# Morton (Z-order) indices interleave the bits of the coordinates
+@njit
+def _spread2(x):
+    # insert a zero bit between the bits of x (up to 31 bits)
+    x = (x | (x << 16)) & 0x0000FFFF0000FFFF
+    x = (x | (x << 8)) & 0x00FF00FF00FF00FF
+    x = (x | (x << 4)) & 0x0F0F0F0F0F0F0F0F
+    x = (x | (x << 2)) & 0x3333333333333333
+    return (x | (x << 1)) & 0x5555555555555555
+
+@njit
+def _compact2(x):
+    # inverse of _spread2
+    x &= 0x5555555555555555
+    x = (x | (x >> 1)) & 0x3333333333333333
+    x = (x | (x >> 2)) & 0x0F0F0F0F0F0F0F0F
+    x = (x | (x >> 4)) & 0x00FF00FF00FF00FF
+    x = (x | (x >> 8)) & 0x0000FFFF0000FFFF
+    return (x | (x >> 16)) & 0x00000000FFFFFFFF
+
+@njit
+def _spread3(x):
+    # insert two zero bits between the bits of x (up to 21 bits)
+    x = (x | (x << 32)) & 0x001F00000000FFFF
+    x = (x | (x << 16)) & 0x001F0000FF0000FF
+    x = (x | (x << 8)) & 0x100F00F00F00F00F
+    x = (x | (x << 4)) & 0x10C30C30C30C30C3
+    return (x | (x << 2)) & 0x1249249249249249
+
+@njit
+def _compact3(x):
+    # inverse of _spread3
+    x &= 0x1249249249249249
+    x = (x | (x >> 2)) & 0x10C30C30C30C30C3
+    x = (x | (x >> 4)) & 0x100F00F00F00F00F
+    x = (x | (x >> 8)) & 0x001F0000FF0000FF
+    x = (x | (x >> 16)) & 0x001F00000000FFFF
+    return (x | (x >> 32)) & 0x00000000001FFFFF
+
+@njit(parallel=True)
+def morton_encode(coords):
+    ''' Compute the Morton (Z-order) index of each 2D or 3D grid coordinate. As for the
+        Hilbert curve, the first axis holds the most significant bit of each level.
+        Inputs:
+            coords - (N, d) int64 array of grid coordinates, d = 2 (lv <= 31) or 3 (lv <= 21)
+        Outputs:
+            keys - (N,) int64 array of indices
+    '''
+    N, dim = coords.shape
+    keys = np.zeros(N, dtype=np.int64)
+    for n in prange(N):
+        if dim == 2:
+            keys[n] = (_spread2(coords[n,0]) << 1) | _spread2(coords[n,1])
+        else:
+            keys[n] = (_spread3(coords[n,0]) << 2) | (_spread3(coords[n,1]) << 1) | _spread3(coords[n,2])
+    return keys
+
+@njit(parallel=True)
+def morton_decode(keys, dim=2):
+    ''' Compute the grid coordinates of Morton indices (inverse of morton_encode). '''
+    N = len(keys)
+    coords = np.zeros((N,dim), dtype=np.int64)
+    for n in prange(N):
+        for i in range(dim):
+            if dim == 2:
+                coords[n,i] = _compact2(keys[n] >> (1-i))
+            else:
+                coords[n,i] = _compact3(keys[n] >> (2-i))
+    return coords
+
+def get_curve_keys(pts, lv=12, curve='hilbert'):
+    ''' Compute the integer keys of a set of points along a space-filling curve.
+        Inputs:
+            pts - (N, 2) or (N, 3) array of points
+            lv - number of levels of the curve
+            curve - 'hilbert' or 'morton'
+        Outputs:
+            keys - (N,) int64 array of (possibly non-consecutive) indices
+    '''
+    dim = pts.shape[1]
+    if lv > (31 if dim == 2 else 21):
+        raise ValueError('lv is too large for %dD int64 keys' % dim)
+    coords = quantize(pts, lv)
+    if curve == 'morton':
+        return morton_encode(coords)
+    elif curve == 'hilbert':
+        return hilbert_encode(coords, lv) if dim == 2 else hilbert_encode3d(coords, lv)
+    raise ValueError("curve must be 'hilbert' or 'morton'")
+
+def get_hilbert_indices(pts, lv=12, curve='hilbert'):
+    ''' Return consecutive indices for a set of points, in traversal order along a
+        space-filling curve.
+        Inputs:
+            pts - (N, 2) or (N, 3) array of points
+            lv - number of levels of the curve
+            curve - 'hilbert' or 'morton'
+        Outputs:
+            inds - (N,) array of point indices in traversal order
+    '''
+    keys = get_curve_keys(pts, lv, curve)
+    nbits = max(len(keys)-1, 1).bit_length()
+    if pts.shape[1]*lv + nbits > 63:
+        return np.argsort(keys, kind='stable')
+    # sorting keys packed with their index is much faster than argsort
+    return np.sort((keys << nbits) | np.arange(len(keys))) & ((1 << nbits) - 1)
+
+def get_block_means(im, bls=3):
+    ''' Compute the mean value of each bls x bls block of an image, padding the last
+        blocks with the mean of the last row and column (as block_reduce in the notebook).
+        Inputs:
+            im - 2D grayscale image
+            bls - block size
+        Outputs:
+            mu - 2D array of block means
+    '''
+    m, n = im.shape
+    cval = np.mean(np.hstack([im[:,-1], im[-1,:]]))
+    pad = ((0, -m % bls), (0, -n % bls))
+    im = np.pad(im.astype(np.float64), pad, constant_values=cval)
+    return im.reshape(im.shape[0]//bls, bls, im.shape[1]//bls, bls).mean(axis=(1,3))
+
+def get_block_counts(im, bls=3, gamma=20, beta=1.):
+    ''' Compute the number of samples g_ij = gamma - floor(gamma*(mu_ij/256)^beta) of each block. '''
+    mu = get_block_means(im, bls)
+    return gamma - np.floor(gamma*(mu/256)**beta).astype(np.int64)
+
+@njit
+def _is_free(grid, pts, x, y, r, cell):
+    # check that no point lies within distance r of (x, y)
+    gy, gx = grid.shape
+    reach = int(np.ceil(r/cell))
+    ci = int(y/cell)
+    cj = int(x/cell)
+    for i in range(max(ci-reach, 0), min(ci+reach+1, gy)):
+        for j in range(max(cj-reach, 0), min(cj+reach+1, gx)):
+            q = grid[i,j]
+            if q >= 0 and (pts[q,0]-x)**2 + (pts[q,1]-y)**2 < r*r:
+                return False
+    return True
+
+@njit
+def _poisson_disk(radius, k, seed):
+    # Bridson's algorithm with a radius varying per block, on a background grid with
+    # cells small enough to hold at most one point. Blocks are visited in random order
+    # to seed new points, so that regions disconnected from the first seed are filled.
+    np.random.seed(seed)
+    m, n = radius.shape
+    rmin = np.inf
+    for i in range(m):
+        for j in range(n):
+            rmin = min(rmin, radius[i,j])
+    if not np.isfinite(rmin):
+        return np.zeros((0,2))
+    cell = rmin/np.sqrt(2)
+    grid = -np.ones((int(np.ceil(m/cell)), int(np.ceil(n/cell))), dtype=np.int64)
+    pts = np.zeros((1024,2))
+    active = np.zeros(1024, dtype=np.int64)
+    npts = 0
+    nactive = 0
+
+    for b in np.random.permutation(m*n):
+        i = b // n
+        j = b % n
+        x = j + np.random.random()
+        y = m - i - 1 + np.random.random()
+        if not np.isfinite(radius[i,j]) or not _is_free(grid, pts, x, y, radius[i,j], cell):
+            continue
+        while True:
+            # insert the point and make it active
+            if npts == len(pts):
+                pts = np.concatenate((pts, np.zeros_like(pts)))
+                active = np.concatenate((active, np.zeros_like(active)))
+            pts[npts,0] = x
+            pts[npts,1] = y
+            grid[int(y/cell), int(x/cell)] = npts
+            active[nactive] = npts
+            nactive += 1
+            npts += 1
+
+            # try k candidates in the annulus [r, 2r] around random active points,
+            # retiring the points without room left around them
+            found = False
+            while nactive > 0 and not found:
+                a = np.random.randint(nactive)
+                p = active[a]
+                r = radius[m - 1 - int(pts[p,1]), int(pts[p,0])]
+                for _ in range(k):
+                    rho = r*np.sqrt(1 + 3*np.random.random())
+                    theta = 2*np.pi*np.random.random()
+                    x = pts[p,0] + rho*np.cos(theta)
+                    y = pts[p,1] + rho*np.sin(theta)
+                    if x < 0 or x >= n or y < 0 or y >= m:
+                        continue
+                    rc = radius[m - 1 - int(y), int(x)]
+                    if np.isfinite(rc) and _is_free(grid, pts, x, y, rc, cell):
+                        found = True
+                        break
+                if not found:
+                    nactive -= 1
+                    active[a] = active[nactive]
+            if not found:
+                break
+    return pts[:npts]
+
+def sample_image(im, bls=3, gamma=20, beta=1., seed=None, method='uniform', k=30):
+    ''' Subdivide image into bls x bls blocks (i,j), and sample points in each block based
+        on intensity, all at once. Dark regions are sampled more often than light regions.
+        Inputs:
+            im - 2D grayscale image on [0,255]
+            bls - block size
+            gamma, beta - number of samples g_ij = gamma - floor(gamma*(mu_ij/256)^beta)
+                          in a block of mean intensity mu_ij
+            seed - seed of the random number generator, for reproducible samples
+            method - 'uniform' for g_ij uniform samples in each block, or 'poisson' for
+                     blue noise: Poisson-disk samples whose radius varies with the
+                     intensity, with about the same density
+            k - number of candidates per active point for method 'poisson'
+        Outputs:
+            pts - (N, 2) array of points, in units of blocks
+            bounds - (xmin, xmax, ymin, ymax) of the sampled domain
+    '''
+    g = get_block_counts(im, bls, gamma, beta)
+    m, n = g.shape
+    if method == 'uniform':
+        # block (i,j) covers [j,j+1] x [m-i-1,m-i]
+        b = np.repeat(np.arange(m*n), g.ravel())
+        u = np.random.default_rng(seed).random((len(b),2))
+        pts = np.stack([b % n + u[:,0], m - 1 - b//n + u[:,1]], axis=1)
+    elif method == 'poisson':
+        # maximal Poisson-disk samples of radius r have a density of about 0.7/r^2
+        with np.errstate(divide='ignore'):
+            radius = np.sqrt(0.7/g)
+        seed = np.random.default_rng(seed).integers(2**31)
+        pts = _poisson_disk(radius, k, seed)
+    else:
+        raise ValueError("method must be 'uniform' or 'poisson'")
+    print("Number of points:", len(pts))
+    bounds = (0,n,0,m)
+    return pts, bounds
@@ -0,0 +1,349 @@
+import numpy as np
+from scipy.spatial import Voronoi, Delaunay
+from numba import njit, prange
+
+# sides of the bounding box (west, east, south, north), as (axis, bound index)
+SIDES = [(0,0), (0,1), (1,2), (1,3)]
+
+def in_bounds(pt, bounds):
+    xmin, xmax, ymin, ymax = bounds
+    return (xmin <= pt[0] <= xmax) and (ymin <= pt[1] <= ymax)
+
+def mirror_points(pts, bounds, sides=None):
+    ''' Mirror points over the sides of a bounding box.
+        Inputs:
+            pts - (N, 2) array of points
+            bounds - (xmin, xmax, ymin, ymax) of the box
+            sides - (N, 4) boolean array of the sides (west, east, south, north) to
+                    mirror each point over (default None, the nearest two sides)
+        Outputs:
+            pts_c - (M, 2) array of mirrored points
+    '''
+    # inspired by: https://stackoverflow.com/questions/28665491/getting-a-bounded-polygon
+    #-coordinates-from-voronoi-cells.
+    if sides is None:
+        xmin, xmax, ymin, ymax = bounds
+        east = pts[:,0] > 0.5*(xmin+xmax)
+        north = pts[:,1] > 0.5*(ymin+ymax)
+        sides = np.stack([pts[:,0] < 0.5*(xmin+xmax), east, pts[:,1] < 0.5*(ymin+ymax), north], axis=1)
+    mirrors = []
+    for k, (axis, b) in enumerate(SIDES):
+        m = np.copy(pts[sides[:,k]])
+        m[:,axis] = 2*bounds[b] - m[:,axis]
+        mirrors.append(m)
+    return np.vstack(mirrors)
+
+def get_region_vertices(vor, ids=None):
+    ''' Flatten the Voronoi regions of a set of input points into arrays.
+        Inputs:
+            vor - scipy Voronoi diagram
+            ids - indices of the input points (default None, all points)
+        Outputs:
+            vert_ids - concatenated vertex indices of the regions
+            vert_ptr - start of each region in vert_ids (length len(ids)+1)
+    '''
+    if ids is None:
+        ids = np.arange(len(vor.point_region))
+    regions = [vor.regions[r] for r in vor.point_region[ids]]
+    vert_ptr = np.cumsum([0] + [len(r) for r in regions])
+    vert_ids = np.fromiter((v for r in regions for v in r), dtype=np.int64, count=vert_ptr[-1])
+    return vert_ids, vert_ptr
+
+def bounded_voronoi(pts, bounds):
+    ''' Compute a Voronoi diagram with rectangular bounds.
+        Inputs:
+            pts - (N, 2) array of points inside the bounds
+            bounds - (xmin, xmax, ymin, ymax) of the box
+        Outputs:
+            vor - scipy Voronoi diagram, in which the cells of the first N points are
+                  bounded by the box
+    '''
+    # create the initial Voronoi diagram.
+    vor = Voronoi(pts, incremental=True)
+
+    # flag the sides crossed by each cell: vertices outside the domain, or -1, which is
+    # scipy's flag for a vertex outside the Voronoi diagram (mirror over all sides).
+    vert_ids, vert_ptr = get_region_vertices(vor)
+    v = np.vstack([vor.vertices, [np.nan, np.nan]])[vert_ids]
+    with np.errstate(invalid='ignore'):
+        out = np.stack([v[:,0] < bounds[0], v[:,0] > bounds[1], v[:,1] < bounds[2], v[:,1] > bounds[3]], axis=1)
+    out[vert_ids == -1] = True
+    sides = np.logical_or.reduceat(np.vstack([out, np.zeros((1,4), dtype=bool)]), vert_ptr[:-1], axis=0)
+    sides[vert_ptr[1:] == vert_ptr[:-1]] = False
+
+    # mirror the boundary points and add them to the diagram. This makes the cells of
+    # all our original points bounded in the rectangular domain.
+    vor.add_points(mirror_points(pts, bounds, sides))
+    return vor
+
+def periodic_voronoi(pts, bounds):
+    ''' Compute a Voronoi diagram that is periodic in x and bounded in y, e.g. to wrap it
+        around a cylinder. Only the points in a band along the left and right sides are
+        copied across (and the points near the bottom and top mirrored), and the band is
+        widened until the empty circles of all cell vertices lie inside the copied region.
+        Inputs:
+            pts - (N, 2) array of points inside the bounds
+            bounds - (xmin, xmax, ymin, ymax) of the periodic strip
+        Outputs:
+            vor - scipy Voronoi diagram, in which the cells of the first N points tile the
+                  strip (cells crossing x = xmin or x = xmax extend past it)
+    '''
+    N = len(pts)
+    xmin, xmax, ymin, ymax = bounds
+    lx, ly = xmax - xmin, ymax - ymin
+    band = 4*np.sqrt(lx*ly/N)
+    while True:
+        # copy the points near the left and right sides across, then mirror all points
+        # near the bottom and top sides.
+        ext = np.vstack([pts, pts[pts[:,0] < xmin+band] + [lx,0], pts[pts[:,0] > xmax-band] - [lx,0]])
+        bottom = ext[ext[:,1] < ymin+band] * [1,-1] + [0,2*ymin]
+        top = ext[ext[:,1] > ymax-band] * [1,-1] + [0,2*ymax]
+        vor = Voronoi(np.vstack([ext, bottom, top]))
+        if band >= max(lx, ly):
+            return vor
+
+        # the cells are exact if no point outside the copied region can be closer to one
+        # of their vertices than the points defining it.
+        vert_ids, vert_ptr = get_region_vertices(vor, np.arange(N))
+        v = vor.vertices[vert_ids]
+        r = np.linalg.norm(v - np.repeat(pts, np.diff(vert_ptr), axis=0), axis=1)
+        if ((vert_ids >= 0) & (v[:,0]-r >= xmin-band) & (v[:,0]+r <= xmax+band)
+                & (v[:,1]-r >= ymin-band) & (v[:,1]+r <= ymax+band)).all():
+            return vor
+        band *= 2
+
+@njit
+def centroid(pts):
+    # compute the centroid of a closed polygon with coordinates given by pts.
+    # the first and last coordinates should be the same.
+    area=0; c=np.zeros(2)
+    for i in range(len(pts)-1):
+        s = pts[i,0]*pts[i+1,1]-pts[i+1,0]*pts[i,1]
+        area += s
+        c+=s*(pts[i]+pts[i+1])
+    c /= 3*area
+    return c
+
+@njit
+def get_centroids(vert_ids, vert_ptr, vert_pos):
+    N = len(vert_ptr)-1
+    centroids = np.zeros((N,2))
+    for i in range(N):
+        verts = vert_ids[vert_ptr[i]:vert_ptr[i+1]]
+        pos = vert_pos[verts]
+        centroids[i] = centroid(pos)
+    return centroids
+
+def sample_density(density, bounds, x, y):
+    ''' Look up the density at points (x, y), with density[0,0] at (xmin, ymin). '''
+    ny, nx = density.shape
+    xmin, xmax, ymin, ymax = bounds
+    j = np.clip(((x - xmin)*nx/(xmax - xmin)).astype(np.int64), 0, nx-1)
+    i = np.clip(((y - ymin)*ny/(ymax - ymin)).astype(np.int64), 0, ny-1)
+    return density[i,j]
+
+def cell_moments(pts, bounds, sides=None, density=None):
+    ''' Compute the area (mass) and first moments of the Voronoi cells of points in a box,
+        using arrays only: each cell is split into one kite per incident Delaunay triangle,
+        spanned by the point, the circumcenter and the midpoints of the two edges at the
+        point. Boundary points are mirrored over the sides that their cells cross, and
+        these sides are detected (and mirrors added) until all cells lie inside the box.
+        Inputs:
+            pts - (N, 2) array of points strictly inside the bounds
+            bounds - (xmin, xmax, ymin, ymax) of the box
+            sides - (N, 4) boolean array of extra sides to mirror each point over, e.g.
+                    from a previous call (default None)
+            density - 2D array of the density over the box, sampled once per kite
+                      triangle (default None, uniform)
+        Outputs:
+            mass - (N,) array of the cell areas (masses)
+            moments - (N, 2) array of the first moments of the cells
+            sides - (N, 4) boolean array of the sides each point was mirrored over
+    '''
+    N = len(pts)
+    xmin, xmax, ymin, ymax = bounds
+    size = max(xmax-xmin, ymax-ymin)
+
+    # start by mirroring a band of points along each side, which usually covers all cells
+    band = 2.5*np.sqrt((xmax-xmin)*(ymax-ymin)/N)
+    near = np.stack([pts[:,0] < xmin+band, pts[:,0] > xmax-band, pts[:,1] < ymin+band, pts[:,1] > ymax-band], axis=1)
+    sides = near if sides is None else sides | near
+    for _ in range(8):
+        ids = np.flatnonzero(sides.any(axis=1))
+        mirrors = mirror_points(pts[ids], bounds, sides[ids])
+        tri = Delaunay(np.vstack([pts, mirrors]))
+        simplices = tri.simplices[(tri.simplices < N).any(axis=1)]
+        p = tri.points[simplices]
+
+        # orient the triangles counterclockwise
+        a, b, c = p[:,0], p[:,1], p[:,2]
+        cw = np.cross(b - a, c - a) < 0
+        simplices[cw] = simplices[cw][:,::-1]
+        p[cw] = p[cw][:,::-1]
+
+        # circumcenters of the triangles
+        a, b, c = p[:,0], p[:,1], p[:,2]
+        ab, ac = b - a, c - a
+        d = 2*np.cross(ab, ac)
+        o = a + np.stack([ac[:,1]*(ab**2).sum(1) - ab[:,1]*(ac**2).sum(1),
+                          ab[:,0]*(ac**2).sum(1) - ac[:,0]*(ab**2).sum(1)], axis=1)/d[:,None]
+
+        # cells must be closed and lie inside the box, otherwise mirror over more sides
+        eps = 1e-9*size
+        out = np.stack([o[:,0] < xmin-eps, o[:,0] > xmax+eps, o[:,1] < ymin-eps, o[:,1] > ymax+eps], axis=1)
+        crossed = np.zeros((N+1,4), dtype=bool)
+        for k in range(3):
+            np.logical_or.at(crossed, np.minimum(simplices[:,k], N), out)
+        hull = np.unique(tri.convex_hull)
+        crossed[hull[hull < N]] = True
+        crossed = crossed[:N] & ~sides
+        if not crossed.any():
+            break
+        sides |= crossed
+
+    # kites (vertex, midpoint, circumcenter) + (vertex, circumcenter, midpoint) of each corner
+    mass = np.zeros(N)
+    moments = np.zeros((N,2))
+    for k in range(3):
+        v, nxt, prv = p[:,k], p[:,(k+1)%3], p[:,(k+2)%3]
+        keep = simplices[:,k] < N
+        for t0, t1 in [(0.5*(v+nxt), o), (o, 0.5*(v+prv))]:
+            area = 0.5*np.cross(t0 - v, t1 - v)
+            cen = (v + t0 + t1)/3
+            if density is not None:
+                area = area*sample_density(density, bounds, cen[:,0], cen[:,1])
+            ids = simplices[keep,k]
+            mass += np.bincount(ids, area[keep], minlength=N)
+            moments[:,0] += np.bincount(ids, (area*cen[:,0])[keep], minlength=N)
+            moments[:,1] += np.bincount(ids, (area*cen[:,1])[keep], minlength=N)
+    return mass, moments, sides
+
+@njit(parallel=True)
+def jump_flood(grid, pts):
+    ''' Label each pixel with its (approximately) nearest point by jump flooding
+        (Rong & Tan, I3D 2006), followed by one extra pass of step 1.
+        Inputs:
+            grid - (ny, nx) int64 array of labels, -1 for pixels without a point, updated
+                   in place
+            pts - (N, 2) array of the points in pixel units (pixel (i,j) has center
+                  (j+0.5, i+0.5))
+    '''
+    ny, nx = grid.shape
+    step = 1
+    while 2*step < max(ny, nx):
+        step *= 2
+    steps = []
+    while step >= 1:
+        steps.append(step)
+        step //= 2
+    steps.append(1)
+    for step in steps:
+        prev = grid.copy()
+        for i in prange(ny):
+            for j in range(nx):
+                best = prev[i,j]
+                bestd = np.inf
+                if best >= 0:
+                    bestd = (pts[best,0]-j-0.5)**2 + (pts[best,1]-i-0.5)**2
+                for di in range(-1, 2):
+                    ii = i + di*step
+                    if ii < 0 or ii >= ny:
+                        continue
+                    for dj in range(-1, 2):
+                        jj = j + dj*step
+                        if jj < 0 or jj >= nx:
+                            continue
+                        s = prev[ii,jj]
+                        if s >= 0:
+                            d = (pts[s,0]-j-0.5)**2 + (pts[s,1]-i-0.5)**2
+                            if d < bestd:
+                                best = s
+                                bestd = d
+                grid[i,j] = best
+
+def pixel_moments(pts, bounds, density=None, shape=None):
+    ''' Compute the mass and first moments of the Voronoi cells of points in a box
+        approximately, by assigning the pixels of a grid to their nearest point with
+        jump flooding.
+        Inputs:
+            pts - (N, 2) array of points inside the bounds
+            bounds - (xmin, xmax, ymin, ymax) of the box
+            density - 2D array of the density over the box, with density[0,0] at
+                      (xmin, ymin) (default None, uniform)
+            shape - (ny, nx) shape of the grid (default None, the shape of density, or
+                    about 16 pixels per point)
+        Outputs:
+            mass - (N,) array of the cell masses
+            moments - (N, 2) array of the first moments of the cells
+    '''
+    xmin, xmax, ymin, ymax = bounds
+    if shape is None:
+        if density is not None:
+            shape = density.shape
+        else:
+            s = np.sqrt(16*len(pts)/((xmax-xmin)*(ymax-ymin)))
+            shape = (int(np.ceil(s*(ymax-ymin))), int(np.ceil(s*(xmax-xmin))))
+    ny, nx = shape
+    if density is None:
+        density = np.ones(shape)
+    elif density.shape != shape:
+        i = (np.arange(ny)*density.shape[0])//ny
+        j = (np.arange(nx)*density.shape[1])//nx
+        density = density[np.ix_(i,j)]
+
+    # seed the grid with the points, in pixel units
+    q = (pts - [xmin, ymin])*[nx/(xmax-xmin), ny/(ymax-ymin)]
+    grid = -np.ones(shape, dtype=np.int64)
+    grid[np.clip(q[:,1].astype(np.int64), 0, ny-1), np.clip(q[:,0].astype(np.int64), 0, nx-1)] = np.arange(len(pts))
+    jump_flood(grid, q)
+
+    # accumulate density-weighted pixel centers per cell
+    y, x = np.mgrid[:ny,:nx]
+    x = xmin + (x + 0.5)*(xmax-xmin)/nx
+    y = ymin + (y + 0.5)*(ymax-ymin)/ny
+    labels = grid.ravel()
+    w = density.ravel()*(xmax-xmin)*(ymax-ymin)/(nx*ny)
+    N = len(pts)
+    mass = np.bincount(labels, w, minlength=N)
+    moments = np.stack([np.bincount(labels, w*x.ravel(), minlength=N),
+                        np.bincount(labels, w*y.ravel(), minlength=N)], axis=1)
+    return mass, moments
+
+def centroidal_voronoi(pts, bounds, iters=1, tol=None, density=None, method='exact', shape=None):
+    ''' Converge to a centroidal Voronoi tessellation with Lloyd's algorithm.
+        Inputs:
+            pts - (N, 2) array of points
+            bounds - (xmin, xmax, ymin, ymax) of the box
+            iters - number of iterations, or maximum number of iterations if tol is set
+            tol - stop once no point moves more than tol times the mean point spacing
+                  (default None, run all iterations)
+            density - 2D array of the density over the box, with density[0,0] at (xmin, ymin),
+                      e.g. the darkness of an image flipped upside down (default None, uniform)
+            method - 'exact' for clipped Voronoi cells, or 'pixel' for the approximate
+                     pixel-assigned cells from jump flooding
+            shape - grid shape for method 'pixel' (see pixel_moments)
+        Outputs:
+            pts - (N, 2) array of the relaxed points
+    '''
+    xmin, xmax, ymin, ymax = bounds
+    eps = 1e-9*max(xmax-xmin, ymax-ymin)
+    pts = np.stack([np.clip(pts[:,0], xmin+eps, xmax-eps), np.clip(pts[:,1], ymin+eps, ymax-eps)], axis=1)
+    spacing = np.sqrt((xmax-xmin)*(ymax-ymin)/len(pts))
+    sides = None
+    for k in range(iters):
+        if method == 'exact':
+            mass, moments, sides = cell_moments(pts, bounds, sides, density)
+        elif method == 'pixel':
+            mass, moments = pixel_moments(pts, bounds, density, shape)
+        else:
+            raise ValueError("method must be 'exact' or 'pixel'")
+
+        # move each point to the centroid of its cell (points with empty cells stay)
+        new = pts.copy()
+        full = mass > 0
+        new[full] = moments[full]/mass[full,None]
+        shift = np.max(np.abs(new - pts)) if len(pts) else 0.
+        pts = new
+        if tol is not None and shift < tol*spacing:
+            break
+    return pts
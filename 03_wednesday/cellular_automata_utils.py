@@ -0,0 +1,578 @@
+import numpy as np
+from functools import lru_cache
+from numba import njit
+
+def pack_cells(cells):
+    ''' Pack rows of binary cell states into 64 cells per uint64 word, cell i at bit i%64
+        of word i//64.
+        Inputs:
+            cells - (..., N) array of 0/1 cell states
+        Outputs:
+            words - (..., ceil(N/64)) uint64 array
+    '''
+    cells = np.asarray(cells, dtype=np.uint8)
+    n = cells.shape[-1]
+    pad = [(0,0)]*(cells.ndim-1) + [(0, -n % 64)]
+    bits = np.packbits(np.pad(cells, pad), axis=-1, bitorder='little')
+    return np.ascontiguousarray(bits).view('<u8')
+
+def unpack_cells(words, n):
+    ''' Unpack rows of uint64 words into n uint8 cell states per row (see pack_cells). '''
+    words = np.ascontiguousarray(words, dtype='<u8')
+    return np.unpackbits(words.view(np.uint8), axis=-1, count=n, bitorder='little')
+
+def get_rule_masks(rule):
+    ''' Convert the 8-bit representation of a rule, with rule[4L+2C+R] the new state of a
+        cell with neighborhood (L,C,R), into word masks: all ones where the rule is 1. '''
+    rule = np.asarray(rule).astype(bool)
+    return np.where(rule, np.uint64(0xFFFFFFFFFFFFFFFF), np.uint64(0))
+
+@njit
+def _mux(s, a, b):
+    # bitwise select: a where s is 1, b where s is 0
+    return b ^ ((a ^ b) & s)
+
+@njit
+def ca_step(words, out, masks, n):
+    ''' Advance a packed elementary cellular automaton of n cells with periodic boundaries by
+        one step, evaluating the rule as a bitwise multiplexer over the words shifted by
+        one cell to the left and right.
+        Inputs:
+            words - (ceil(n/64),) uint64 array of the current states
+            out - (ceil(n/64),) uint64 array for the new states
+            masks - (8,) uint64 array of the rule masks (see get_rule_masks)
+            n - number of cells
+    '''
+    nw = len(words)
+    top = (n-1) % 64
+    one = np.uint64(1)
+    last = np.uint64(top)
+    tail = np.uint64(0xFFFFFFFFFFFFFFFF) >> np.uint64(63 - top)
+    for k in range(nw):
+        c = words[k]
+        # left neighbor: the previous cell, wrapping around from cell n-1 to cell 0
+        if k > 0:
+            l = (c << one) | (words[k-1] >> np.uint64(63))
+        else:
+            l = (c << one) | ((words[nw-1] >> last) & one)
+        # right neighbor: the next cell, wrapping around from cell 0 to cell n-1
+        if k < nw-1:
+            r = (c >> one) | (words[k+1] << np.uint64(63))
+        else:
+            r = (c >> one) | ((words[0] & one) << last)
+        lo = _mux(c, _mux(r, masks[3], masks[2]), _mux(r, masks[1], masks[0]))
+        hi = _mux(c, _mux(r, masks[7], masks[6]), _mux(r, masks[5], masks[4]))
+        out[k] = _mux(l, hi, lo)
+    out[nw-1] &= tail
+
+@njit
+def _run_ca(words, steps, masks, n, stride, history):
+    # run the automaton, keeping every stride-th row in history (as a ring buffer if it
+    # is shorter than the run), and return the number of rows kept
+    rows = len(history)
+    history[0] = words
+    kept = 1
+    cur = words.copy()
+    nxt = np.zeros_like(words)
+    for t in range(1, steps+1):
+        ca_step(cur, nxt, masks, n)
+        cur, nxt = nxt, cur
+        if t % stride == 0:
+            history[kept % rows] = cur
+            kept += 1
+    return kept
+
+def cellular_automaton_packed(rule, steps, init, stride=1, keep=None, packed=False):
+    ''' Simulate an elementary cellular automaton with periodic boundaries on bit-packed
+        cells, storing 64 cells per uint64 word.
+        Inputs:
+            rule - the 8-bit representation of the rule (see get_rule)
+            steps - the number of iterations to perform
+            init - the initial state of the cells
+            stride - keep every stride-th row of the history
+            keep - keep only the last keep rows (default None, all rows)
+            packed - return the packed words instead of the cell states
+        Outputs:
+            cells - (rows, N) uint8 array of the kept rows, or (rows, ceil(N/64)) uint64
+                    array if packed, in chronological order
+    '''
+    n = len(init)
+    words = pack_cells(init)
+    rows = steps//stride + 1
+    if keep is not None:
+        rows = min(rows, keep)
+    history = np.zeros((rows, len(words)), dtype=np.uint64)
+    kept = _run_ca(words, steps, get_rule_masks(rule), n, stride, history)
+    if kept > rows:
+        # rotate the ring buffer into chronological order
+        history = np.roll(history, -(kept % rows), axis=0)
+    return history if packed else unpack_cells(history, n)
+
+@njit
+def _shift_rows(words, w, left, right):
+    # left/right neighbors of every cell of the packed rows, with periodic boundaries
+    H, nw = words.shape
+    one = np.uint64(1)
+    last = np.uint64((w-1) % 64)
+    for i in range(H):
+        for k in range(nw):
+            c = words[i,k]
+            if k > 0:
+                left[i,k] = (c << one) | (words[i,k-1] >> np.uint64(63))
+            else:
+                left[i,k] = (c << one) | ((words[i,nw-1] >> last) & one)
+            if k < nw-1:
+                right[i,k] = (c >> one) | (words[i,k+1] << np.uint64(63))
+            else:
+                right[i,k] = (c >> one) | ((words[i,0] & one) << last)
+
+@njit
+def life_step(words, out, w):
+    ''' Advance a packed Game of Life with periodic boundaries by one generation. The
+        neighbor counts of 64 cells are added at once with bitwise adders.
+        Inputs:
+            words - (H, ceil(w/64)) uint64 array of the current states (see pack_cells)
+            out - (H, ceil(w/64)) uint64 array for the new states
+            w - number of cells per row
+    '''
+    H, nw = words.shape
+    left = np.empty_like(words)
+    right = np.empty_like(words)
+    _shift_rows(words, w, left, right)
+    tail = np.uint64(0xFFFFFFFFFFFFFFFF) >> np.uint64(63 - (w-1) % 64)
+    for i in range(H):
+        up = (i - 1) % H
+        down = (i + 1) % H
+        for k in range(nw):
+            # 2-bit sums of the three cells above, the two cells beside, and the three below
+            l, c, r = left[up,k], words[up,k], right[up,k]
+            a0 = l ^ c ^ r
+            a1 = (l & c) | (r & (l ^ c))
+            l, r = left[i,k], right[i,k]
+            b0 = l ^ r
+            b1 = l & r
+            l, c, r = left[down,k], words[down,k], right[down,k]
+            d0 = l ^ c ^ r
+            d1 = (l & c) | (r & (l ^ c))
+            # add them up into the 4 bits y3 y2 y1 y0 of the neighbor count
+            x0 = a0 ^ b0
+            carry = a0 & b0
+            x1 = a1 ^ b1 ^ carry
+            x2 = (a1 & b1) | (carry & (a1 ^ b1))
+            y0 = x0 ^ d0
+            carry = x0 & d0
+            y1 = x1 ^ d1 ^ carry
+            carry = (x1 & d1) | (carry & (x1 ^ d1))
+            y2 = x2 ^ carry
+            y3 = x2 & carry
+            # alive with 3 neighbors, or with 2 neighbors if alive already
+            out[i,k] = y1 & ~y2 & ~y3 & (y0 | words[i,k])
+        out[i,nw-1] &= tail
+
+@njit
+def life_steps(words, w, steps):
+    ''' Advance a packed Game of Life by a number of generations, returning the new words. '''
+    cur = words.copy()
+    nxt = np.empty_like(words)
+    for t in range(steps):
+        life_step(cur, nxt, w)
+        cur, nxt = nxt, cur
+    return cur
+
+# HashLife (Gosper 1984): the plane is a quadtree of nodes of size 2^k, with nodes a (top
+# left), b (top right), c (bottom left) and d (bottom right). Equal nodes are shared, and
+# the future of each node's centre is memoized, so that repetitive patterns are advanced
+# by huge numbers of generations at the cost of a few new nodes. This follows the compact
+# formulation of J. Williams (https://johnhw.github.io/hashlife/index.md.html).
+class Node:
+    ''' Quadtree node of level k with quadrants a, b, c, d and population n. Nodes are only
+        built through join, so equal nodes are the same object and hash by identity. '''
+    __slots__ = ('k', 'a', 'b', 'c', 'd', 'n')
+
+    def __init__(self, k, a, b, c, d, n):
+        self.k, self.a, self.b, self.c, self.d, self.n = k, a, b, c, d, n
+
+OFF = Node(0, None, None, None, None, 0)
+ON = Node(0, None, None, None, None, 1)
+
+# largest number of memoized nodes and successors before the caches are emptied
+MAX_NODES = 1 << 20
+
+@lru_cache(maxsize=None)
+def join(a, b, c, d):
+    ''' Combine four nodes of level k into a node of level k+1. '''
+    return Node(a.k + 1, a, b, c, d, a.n + b.n + c.n + d.n)
+
+@lru_cache(maxsize=None)
+def get_zero(k):
+    ''' Empty node of level k. '''
+    return OFF if k == 0 else join(get_zero(k-1), get_zero(k-1), get_zero(k-1), get_zero(k-1))
+
+def centre(m):
+    ''' Pad a node with an empty border into a node of level k+1 with m at its centre. '''
+    z = get_zero(m.k - 1)
+    return join(join(z, z, z, m.a), join(z, z, m.b, z), join(z, m.c, z, z), join(m.d, z, z, z))
+
+def _life(a, b, c, d, e, f, g, h, i):
+    # next state of the centre cell e of a 3x3 block of leaves
+    n = a.n + b.n + c.n + d.n + f.n + g.n + h.n + i.n
+    return ON if n == 3 or (n == 2 and e.n) else OFF
+
+def _life_4x4(m):
+    # the centre 2x2 of a 4x4 node, one generation later
+    ab = _life(m.a.a, m.a.b, m.b.a, m.a.c, m.a.d, m.b.c, m.c.a, m.c.b, m.d.a)
+    bc = _life(m.a.b, m.b.a, m.b.b, m.a.d, m.b.c, m.b.d, m.c.b, m.d.a, m.d.b)
+    cb = _life(m.a.c, m.a.d, m.b.c, m.c.a, m.c.b, m.d.a, m.c.c, m.c.d, m.d.c)
+    da = _life(m.a.d, m.b.c, m.b.d, m.c.b, m.d.a, m.d.b, m.c.d, m.d.c, m.d.d)
+    return join(ab, bc, cb, da)
+
+@lru_cache(maxsize=None)
+def successor(m, j):
+    ''' The centre node of level k-1 of a node of level k >= 2, 2^min(j, k-2) generations
+        later. '''
+    if m.n == 0:
+        return m.a
+    if m.k == 2:
+        return _life_4x4(m)
+    j = min(j, m.k - 2)
+    # the nine overlapping subnodes of level k-1, advanced to their centres
+    c1 = successor(m.a, j)
+    c2 = successor(join(m.a.b, m.b.a, m.a.d, m.b.c), j)
+    c3 = successor(m.b, j)
+    c4 = successor(join(m.a.c, m.a.d, m.c.a, m.c.b), j)
+    c5 = successor(join(m.a.d, m.b.c, m.c.b, m.d.a), j)
+    c6 = successor(join(m.b.c, m.b.d, m.d.a, m.d.b), j)
+    c7 = successor(m.c, j)
+    c8 = successor(join(m.c.b, m.d.a, m.c.d, m.d.c), j)
+    c9 = successor(m.d, j)
+    if j < m.k - 2:
+        # already far enough: just take the centres
+        return join(join(c1.d, c2.c, c4.b, c5.a), join(c2.d, c3.c, c5.b, c6.a),
+                    join(c4.d, c5.c, c7.b, c8.a), join(c5.d, c6.c, c8.b, c9.a))
+    # otherwise advance the four overlapping quadrants once more
+    return join(successor(join(c1, c2, c4, c5), j), successor(join(c2, c3, c5, c6), j),
+                successor(join(c4, c5, c7, c8), j), successor(join(c5, c6, c8, c9), j))
+
+def clear_hashlife():
+    ''' Empty the memoized nodes and successors of HashLife to free their memory. Nodes
+        built before remain valid, they are just no longer shared with those built after. '''
+    join.cache_clear()
+    get_zero.cache_clear()
+    successor.cache_clear()
+    _leaf_block.cache_clear()
+
+def crop(m, x, y):
+    ''' Remove empty borders of a node at (x, y), as long as it stays of level 2 or more.
+        Returns the cropped node and its new position. '''
+    while m.k > 2:
+        border = (m.a.a, m.a.b, m.a.c, m.b.a, m.b.b, m.b.d, m.c.a, m.c.c, m.c.d, m.d.b, m.d.c, m.d.d)
+        if any(q.n for q in border):
+            break
+        s = 1 << (m.k - 2)
+        m, x, y = join(m.a.d, m.b.c, m.c.b, m.d.a), x + s, y + s
+    return m, x, y
+
+def advance(m, x, y, steps):
+    ''' Advance a node at (x, y) (column and row of its top left cell) by a number of
+        generations on the unbounded plane, in powers of two. The caches are emptied
+        whenever they hold more than MAX_NODES entries.
+        Returns the new node and its position. '''
+    j = 0
+    while steps:
+        if steps & 1:
+            m, x, y = crop(m, x, y)
+            # pad so that the pattern cannot leave the centre within 2^j generations
+            while m.k < j + 1:
+                m, x, y = centre(m), x - (1 << (m.k - 1)), y - (1 << (m.k - 1))
+            for _ in range(2):
+                m, x, y = centre(m), x - (1 << (m.k - 1)), y - (1 << (m.k - 1))
+            s = 1 << (m.k - 2)
+            m, x, y = successor(m, j), x + s, y + s
+            if join.cache_info().currsize + successor.cache_info().currsize > MAX_NODES:
+                clear_hashlife()
+        steps >>= 1
+        j += 1
+    return crop(m, x, y)
+
+def from_cells(cells):
+    ''' Build a quadtree node at (0, 0) from a 2D array of 0/1 cell states. '''
+    H, W = cells.shape
+    k = max(int(np.ceil(np.log2(max(H, W, 4)))), 2)
+    grid = np.zeros((1 << k, 1 << k), dtype=bool)
+    grid[:H,:W] = cells
+    nodes = [[ON if v else OFF for v in row] for row in grid]
+    while len(nodes) > 1:
+        nodes = [[join(nodes[i][j], nodes[i][j+1], nodes[i+1][j], nodes[i+1][j+1])
+                  for j in range(0, len(nodes), 2)] for i in range(0, len(nodes), 2)]
+    return nodes[0][0]
+
+@lru_cache(maxsize=None)
+def _leaf_block(m):
+    # the cells of a small node as an array
+    if m.k == 0:
+        return np.array([[m.n]], dtype=np.uint8)
+    s = 1 << (m.k - 1)
+    out = np.zeros((2*s, 2*s), dtype=np.uint8)
+    out[:s,:s] = _leaf_block(m.a)
+    out[:s,s:] = _leaf_block(m.b)
+    out[s:,:s] = _leaf_block(m.c)
+    out[s:,s:] = _leaf_block(m.d)
+    return out
+
+def to_cells(m, x, y, window):
+    ''' Render the cells of a node at (x, y) inside a window.
+        Inputs:
+            m, x, y - node and the column and row of its top left cell
+            window - (row, column, height, width) of the window
+        Outputs:
+            cells - (height, width) uint8 array of the cell states
+    '''
+    r0, c0, H, W = window
+    out = np.zeros((H, W), dtype=np.uint8)
+    stack = [(m, x, y)]
+    while stack:
+        m, x, y = stack.pop()
+        size = 1 << m.k
+        if m.n == 0 or x >= c0 + W or y >= r0 + H or x + size <= c0 or y + size <= r0:
+            continue
+        if m.k <= 4:
+            block = _leaf_block(m)
+            i0, j0 = max(y, r0), max(x, c0)
+            i1, j1 = min(y + size, r0 + H), min(x + size, c0 + W)
+            out[i0-r0:i1-r0, j0-c0:j1-c0] = block[i0-y:i1-y, j0-x:j1-x]
+            continue
+        s = size >> 1
+        stack += [(m.a, x, y), (m.b, x + s, y), (m.c, x, y + s), (m.d, x + s, y + s)]
+    return out
+
+def life_frames(steps, init, every=1, method='dense', window=None):
+    ''' Generate snapshots of Conway's Game of Life every few generations, without storing
+        the whole run.
+        Inputs:
+            steps - the number of generations to perform
+            init - the initial state of the cells
+            every - the number of generations between snapshots
+            method - 'dense' for bit-parallel updates of a periodic grid (best for busy
+                     soups), or 'hashlife' for HashLife on the unbounded plane (best for
+                     sparse, long-lived patterns)
+            window - (row, column, height, width) of the snapshots for method 'hashlife',
+                     relative to init (default None, the frame of init)
+        Outputs:
+            generator of (generation, cells) pairs, starting with generation 0
+    '''
+    H, W = init.shape
+    if method == 'dense':
+        words = pack_cells(init)
+        yield 0, unpack_cells(words, W)
+        for t in range(every, steps+1, every):
+            words = life_steps(words, W, every)
+            yield t, unpack_cells(words, W)
+    elif method == 'hashlife':
+        window = (0, 0, H, W) if window is None else window
+        clear_hashlife() # start from empty caches, rather than those of earlier runs
+        m, x, y = from_cells(np.asarray(init)), 0, 0
+        yield 0, to_cells(m, x, y, window)
+        for t in range(every, steps+1, every):
+            m, x, y = advance(m, x, y, every)
+            yield t, to_cells(m, x, y, window)
+    else:
+        raise ValueError("method must be 'dense' or 'hashlife'")
+
+def game_of_life_frames(steps, init, every=1, method='dense', window=None):
+    ''' Collect the snapshots of life_frames into an array, e.g. for make_animation2d. '''
+    return np.array([cells for t, cells in life_frames(steps, init, every, method, window)])
+
+# Moore neighborhood offsets (rows, columns), and the sentinel of cells that never attach
+DJ = np.array([-1, 0, 1, 0, -1, -1, 1, 1])
+DK = np.array([0, -1, 0, 1, -1, 1, -1, 1])
+NEVER = np.iinfo(np.uint32).max
+
+def initialize_dla_grid(m, n, N, Nf=1, seed=None, proba=None):
+    ''' Initialize a grid and particles for diffusion-limited aggregation, as in
+        initialize_dla, choosing the spots directly among the flat cell indices.
+        Inputs:
+            m, n - grid dimensions (rows and columns)
+            N - number of total particles, smaller than m times n
+            Nf - number of initial fixed particles (the center cell if Nf = 1)
+            seed - random seed
+            proba - (m, n) array of the relative probability of each cell for the mobile
+                    particles (default None, uniform)
+        Outputs:
+            particles - (N, 2) array of the particle positions (j, k), fixed particles first
+            cells - (m, n) uint8 array of the cell states (0 empty, 1 mobile, 2 fixed)
+    '''
+    if N > m*n:
+        raise ValueError("Number of particles must be smaller than m times n.")
+    rng = np.random.default_rng(seed)
+    if Nf == 1:
+        fixed = np.array([n*(m//2) + n//2])
+    else:
+        fixed = rng.choice(m*n, size=Nf, replace=False)
+    p = np.ones(m*n) if proba is None else np.array(proba, dtype=float).ravel()
+    p[fixed] = 0
+    mobile = rng.choice(m*n, size=N-Nf, replace=False, p=p/p.sum())
+    flat = np.concatenate([fixed, mobile])
+    particles = np.stack(np.divmod(flat, n), axis=1)
+    cells = np.zeros(m*n, dtype=np.uint8)
+    cells[mobile] = 1
+    cells[fixed] = 2
+    return particles, cells.reshape(m, n)
+
+@njit
+def _dla_walk(cells, walkers, T, seed, attach):
+    # move the walkers in random order for T steps, swapping walkers that attach out of the
+    # active range, and return the number of steps performed
+    np.random.seed(seed)
+    m, n = cells.shape
+    active = len(walkers)
+    order = np.arange(active)
+    js = np.empty(8, dtype=np.int64)
+    ks = np.empty(8, dtype=np.int64)
+    for t in range(1, T+1):
+        if active == 0:
+            return t - 1
+        np.random.shuffle(order)
+        for i in order:
+            j, k = walkers[i,0], walkers[i,1]
+            empty = 0
+            stick = False
+            for s in range(8):
+                jj, kk = j + DJ[s], k + DK[s]
+                if jj < 0:
+                    jj += m
+                elif jj >= m:
+                    jj -= m
+                if kk < 0:
+                    kk += n
+                elif kk >= n:
+                    kk -= n
+                c = cells[jj,kk]
+                if c == 2:
+                    stick = True
+                    break
+                if c == 0:
+                    js[empty], ks[empty] = jj, kk
+                    empty += 1
+            if stick:
+                cells[j,k] = 2
+                attach[j,k] = t
+                walkers[i,0] = -1
+            elif empty > 0:
+                s = np.random.randint(empty)
+                cells[j,k] = 0
+                cells[js[s],ks[s]] = 1
+                walkers[i,0], walkers[i,1] = js[s], ks[s]
+        # compact the walkers that are still mobile
+        kept = 0
+        for i in range(active):
+            if walkers[i,0] >= 0:
+                walkers[kept] = walkers[i]
+                kept += 1
+        active = kept
+        order = np.arange(active)
+    return T
+
+def dla_grid(particles, init, T, seed=12):
+    ''' Simulate diffusion-limited aggregation on a periodic grid with the rules of
+        diffusion_limited_aggregation, storing the step at which each cell attached to the
+        aggregate instead of the whole history.
+        Inputs:
+            particles - (N, 2) array of the initial particle positions (j, k)
+            init - (m, n) array of the initial cell states (0 empty, 1 mobile, 2 fixed)
+            T - maximum number of time steps (stops early once all particles are fixed)
+            seed - random seed
+        Outputs:
+            attach - (m, n) uint32 array of the step at which each cell became fixed (0 for
+                     the initial fixed particles, NEVER for cells that stay unfixed)
+            cells - (m, n) uint8 array of the final cell states
+    '''
+    cells = np.array(init, dtype=np.uint8)
+    attach = np.full(cells.shape, NEVER, dtype=np.uint32)
+    attach[cells == 2] = 0
+    particles = np.asarray(particles)
+    mobile = cells[particles[:,0], particles[:,1]] == 1
+    walkers = np.array(particles[mobile], dtype=np.int64)
+    _dla_walk(cells, walkers, T, seed, attach)
+    return attach, cells
+
+def dla_frame(attach, t):
+    ''' Reconstruct the fixed cells (state 2) of an aggregate after step t. '''
+    return np.where(attach <= t, 2, 0).astype(np.uint8)
+
+def dla_age(attach, T=None):
+    ''' Color the fixed cells by attachment time, 1 for the seeds fading to 0 at step T
+        (default the last attachment), and 0 for cells that never attached. '''
+    fixed = attach != NEVER
+    if T is None:
+        T = max(attach[fixed].max(), 1)
+    return np.where(fixed, (T - np.minimum(attach, T))/T, 0.)
+
+@njit
+def _dla_radial(attach, N, launch, kill, seed):
+    # grow an aggregate from the center of the grid one walker at a time, and return the
+    # number of particles attached
+    np.random.seed(seed)
+    m, n = attach.shape
+    cj, ck = m//2, n//2
+    attach[cj,ck] = 0
+    rmax = 1.
+    limit = min(cj, ck) - 2
+    count = 1
+    while count < N:
+        if rmax + launch + 2 > limit:
+            break
+        # launch from a random point on the circle just outside the aggregate
+        r0 = rmax + launch
+        a = 2*np.pi*np.random.random()
+        j = cj + int(np.round(r0*np.sin(a)))
+        k = ck + int(np.round(r0*np.cos(a)))
+        while True:
+            d = np.sqrt((j - cj)**2 + (k - ck)**2)
+            if d > kill*r0 or d > limit:
+                # wandered off: relaunch
+                a = 2*np.pi*np.random.random()
+                j = cj + int(np.round(r0*np.sin(a)))
+                k = ck + int(np.round(r0*np.cos(a)))
+                continue
+            if d > rmax + launch + 2:
+                # far from the aggregate: jump to a random point of the circle that it
+                # cannot cross without reaching the launch circle first
+                L = d - rmax - launch
+                a = 2*np.pi*np.random.random()
+                j += int(np.round(L*np.sin(a)))
+                k += int(np.round(L*np.cos(a)))
+                continue
+            stick = False
+            for s in range(8):
+                if attach[j + DJ[s], k + DK[s]] != NEVER:
+                    stick = True
+                    break
+            if stick:
+                attach[j,k] = count
+                count += 1
+                rmax = max(rmax, d)
+                break
+            s = np.random.randint(8)
+            j += DJ[s]
+            k += DK[s]
+    return count
+
+def dla_radial(N, size, launch=5, kill=3., seed=12):
+    ''' Grow a sparse aggregate from a seed in the middle of the grid, releasing one walker
+        at a time on a circle just outside the aggregate (Witten and Sander's original
+        model). Walkers far from the aggregate take long jumps, and walkers that wander
+        beyond the kill radius are released again.
+        Inputs:
+            N - number of particles
+            size - (m, n) dimensions of the grid
+            launch - distance between the aggregate and the launch circle
+            kill - radius of the kill circle, relative to the launch circle
+            seed - random seed
+        Outputs:
+            attach - (m, n) uint32 array of the order in which each cell attached (0 for the
+                     seed, NEVER for empty cells); stops early if the aggregate reaches
+                     the edge of the grid
+    '''
+    attach = np.full(size, NEVER, dtype=np.uint32)
+    _dla_radial(attach, N, launch, kill, seed)
+    return attach
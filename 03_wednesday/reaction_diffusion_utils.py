@@ -1,7 +1,18 @@
 import numpy as np
+import time
+import scipy.fft as fft
+import scipy.integrate as integrate
+import scipy.ndimage as ndimage
+from scipy.sparse import coo_matrix, csr_matrix, bmat, diags, identity
+from scipy.sparse.csgraph import connected_components
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from functools import lru_cache
 import matplotlib
 import matplotlib.cm as cm
 import matplotlib.pyplot as plt
+from numba import njit, prange
 
 def get_hex(name):
     ''' Return Hex color codes.'''
@@ -42,4 +53,442 @@ def custom_cmap(name):
     # Create custom colormap
     tuples = list(zip(map(norm, cvals), hex))
     cmap = matplotlib.colors.LinearSegmentedColormap.from_list("", tuples)
-    return cmap
\ No newline at end of file
+    return cmap
+
+@njit(parallel=True)
+def gray_scott_step(u, v, un, vn, dt, Du, Dv, f, k, invh2):
+    ''' Take one forward Euler step of the Gray–Scott model with periodic boundaries,
+        evaluating the 5-point Laplacians and the reaction terms in a single pass.
+        Inputs:
+            u, v - (N, M) arrays of the current concentrations
+            un, vn - (N, M) arrays for the new concentrations
+            dt - the time step
+            Du, Dv - the diffusion constants
+            f - the feed rate
+            k - the kill rate
+            invh2 - the inverse squared lattice spacing
+    '''
+    N, M = u.shape
+    for i in prange(N):
+        im = i-1 if i > 0 else N-1
+        ip = i+1 if i < N-1 else 0
+        for j in range(M):
+            jm = j-1 if j > 0 else M-1
+            jp = j+1 if j < M-1 else 0
+            # written without numeric literals, so that float32 inputs stay float32
+            uc, vc = u[i,j], v[i,j]
+            Lu = ((u[im,j] - uc) + (u[ip,j] - uc) + (u[i,jm] - uc) + (u[i,jp] - uc))*invh2
+            Lv = ((v[im,j] - vc) + (v[ip,j] - vc) + (v[i,jm] - vc) + (v[i,jp] - vc))*invh2
+            uvv = uc*vc*vc
+            un[i,j] = uc + dt*(Du*Lu - uvv + f - f*uc)
+            vn[i,j] = vc + dt*(Dv*Lv + uvv - (f + k)*vc)
+
+@njit
+def _gray_scott_run(u, v, un, vn, steps, dt, Du, Dv, f, k, invh2):
+    # take a number of steps, alternating between the two pairs of buffers; the result is
+    # in u, v if steps is even and in un, vn otherwise
+    for n in range(steps):
+        if n % 2 == 0:
+            gray_scott_step(u, v, un, vn, dt, Du, Dv, f, k, invh2)
+        else:
+            gray_scott_step(un, vn, u, v, dt, Du, Dv, f, k, invh2)
+
+def solve_gray_scott(ti, tf, nt, yi, args, dt=None, dtype=np.float64):
+    ''' Integrate the Gray–Scott model on [-1,1]x[-1,1] with forward Euler steps of the fused
+        stencil gray_scott_step, in preallocated buffers.
+        Inputs:
+            ti, tf - start and end integration times
+            nt - number of evenly spaced output time points in [ti, tf]
+            yi - initial concentrations [u, v]
+            args - tuples of model parameters (Du, Dv, f, k)
+            dt - the largest time step (default None, 90% of the stability limit of the
+                 diffusion, and at most 1)
+            dtype - np.float64, or np.float32 for half the memory traffic
+        Outputs:
+            u - (N, N, nt) array of the concentration of u at the output times, as in solve
+    '''
+    u, v = (np.array(c, dtype=dtype) for c in yi)
+    N = len(u)
+    Du, Dv, f, k = args
+    h = 2./N
+    if dt is None:
+        dt = min(0.9*h*h/(4*max(Du, Dv)), 1.)
+    cast = np.dtype(dtype).type
+    params = [cast(x) for x in (Du, Dv, f, k, 1./(h*h))]
+    un, vn = np.empty_like(u), np.empty_like(v)
+    t_eval = np.linspace(ti, tf, nt)
+    out = np.empty((N, N, nt), dtype=dtype)
+    out[:,:,0] = u
+
+    start_time = time.time()
+    for n in range(1, nt):
+        # split each output interval into equal steps no longer than dt
+        steps = int(np.ceil((t_eval[n] - t_eval[n-1])/dt - 1e-9))
+        _gray_scott_run(u, v, un, vn, steps, cast((t_eval[n] - t_eval[n-1])/steps), *params)
+        if steps % 2:
+            u, un, v, vn = un, u, vn, v
+        out[:,:,n] = u
+    print('elapsed time (s):', time.time() - start_time)
+
+    return out
+
+def gray_scott_reaction(u, v, f, k):
+    ''' Reaction terms of the Gray–Scott model, for solve_spectral. '''
+    uvv = u*v*v
+    return -uvv + f*(1. - u), uvv - (f + k)*v
+
+@lru_cache(maxsize=32)
+def get_etd_operators(N, D, dt, laplacian='fd'):
+    ''' Build the per-wavenumber operators of the ETDRK2 scheme for diffusion on an N x N
+        periodic grid of [-1,1]x[-1,1], for the real FFT layout of scipy.fft.rfft2.
+        Inputs:
+            N - the system size in each dimension
+            D - the diffusion constant
+            dt - the time step
+            laplacian - 'fd' for the eigenvalues of the 5-point Laplacian, matching solve,
+                        or 'spectral' for the exact -|k|^2
+        Outputs:
+            E - exp(L dt), the exact propagator of the diffusion
+            phi1 - (exp(L dt) - 1)/L, weighting the reaction at the start of the step
+            phi2 - (exp(L dt) - 1 - L dt)/(L^2 dt), weighting the correction of the reaction
+    '''
+    h = 2./N
+    ky = 2*np.pi*np.fft.fftfreq(N, d=h)[:,None]
+    kx = 2*np.pi*np.fft.rfftfreq(N, d=h)[None,:]
+    if laplacian == 'fd':
+        L = -4./(h*h)*(np.sin(kx*h/2)**2 + np.sin(ky*h/2)**2)
+    elif laplacian == 'spectral':
+        L = -(kx**2 + ky**2)
+    else:
+        raise ValueError("laplacian must be 'fd' or 'spectral'")
+    z = D*L*dt
+    E = np.exp(z)
+    # use the Taylor series where the closed forms lose all their digits
+    small = np.abs(z) < 1e-3
+    zs = np.where(small, 1., z)
+    phi1 = np.where(small, dt*(1 + z/2 + z*z/6), dt*np.expm1(zs)/zs)
+    phi2 = np.where(small, dt*(1/2 + z/6 + z*z/24), dt*(np.expm1(zs) - zs)/(zs*zs))
+    return E, phi1, phi2
+
+def solve_spectral(ti, tf, nt, yi, args, reaction=gray_scott_reaction, dt=1., laplacian='fd'):
+    ''' Integrate a two-component reaction–diffusion system on [-1,1]x[-1,1] with periodic
+        boundaries by exponential time differencing (ETDRK2 of Cox and Matthews). The
+        diffusion is solved exactly in Fourier space, so the time step is only limited by
+        the reaction terms, which are handled explicitly.
+        Inputs:
+            ti, tf - start and end integration times
+            nt - number of evenly spaced output time points in [ti, tf]
+            yi - initial concentrations [u, v]
+            args - tuples of model parameters (Du, Dv, ...), the diffusion constants
+                   followed by the parameters of the reaction (f, k for Gray–Scott)
+            reaction - function (u, v, *params) returning the reaction terms of u and v
+            dt - the largest time step
+            laplacian - 'fd' or 'spectral' (see get_etd_operators)
+        Outputs:
+            u - (N, N, nt) array of the concentration of u at the output times, as in solve
+    '''
+    u, v = (np.array(c, dtype=float) for c in yi)
+    N = len(u)
+    Du, Dv, params = args[0], args[1], args[2:]
+    # equal steps within each output interval, so that the operators are built only once
+    steps = max(int(np.ceil((tf - ti)/max(nt - 1, 1)/dt - 1e-9)), 1)
+    h = (tf - ti)/max(nt - 1, 1)/steps
+    Eu, phi1u, phi2u = get_etd_operators(N, Du, h, laplacian)
+    Ev, phi1v, phi2v = get_etd_operators(N, Dv, h, laplacian)
+    rfft2 = lambda a: fft.rfft2(a, workers=-1)
+    irfft2 = lambda a: fft.irfft2(a, s=(N, N), workers=-1)
+    out = np.empty((N, N, nt))
+    out[:,:,0] = u
+
+    start_time = time.time()
+    uh, vh = rfft2(u), rfft2(v)
+    for n in range(1, nt):
+        for _ in range(steps):
+            ru, rv = (rfft2(r) for r in reaction(u, v, *params))
+            # predictor: exact diffusion, reaction frozen over the step
+            ah = Eu*uh + phi1u*ru
+            bh = Ev*vh + phi1v*rv
+            a, b = irfft2(ah), irfft2(bh)
+            # corrector: linear interpolation of the reaction over the step
+            sa, sb = (rfft2(r) for r in reaction(a, b, *params))
+            uh = ah + phi2u*(sa - ru)
+            vh = bh + phi2v*(sb - rv)
+            u, v = irfft2(uh), irfft2(vh)
+        out[:,:,n] = u
+    print('elapsed time (s):', time.time() - start_time)
+
+    return out
+
+@lru_cache(maxsize=8)
+def get_laplacian_matrix(N):
+    ''' Sparse matrix of the 5-point Laplacian on an N x N periodic grid of [-1,1]x[-1,1],
+        the same operator as laplacian_2d acting on a flattened array.
+        Inputs:
+            N - the system size in each dimension
+        Outputs:
+            L - (N*N, N*N) sparse matrix in CSR format
+    '''
+    h = 2./N
+    idx = np.arange(N*N).reshape(N, N)
+    neighbors = [np.roll(idx, s, axis=a).ravel() for a in (0, 1) for s in (1, -1)]
+    rows = np.tile(idx.ravel(), 5)
+    cols = np.concatenate([idx.ravel()] + neighbors)
+    data = np.repeat([-4., 1., 1., 1., 1.], N*N)/(h*h)
+    return csr_matrix((data, (rows, cols)), shape=(N*N, N*N))
+
+def gray_scott_jacobian(t, y, N, Du, Dv, f, k):
+    ''' Analytic Jacobian of gray_scott, for the implicit solvers of solve_ivp.
+        Inputs:
+            t, y, N, Du, Dv, f, k - as in gray_scott
+        Outputs:
+            J - (2*N*N, 2*N*N) sparse matrix in CSC format, with 7 entries per row
+    '''
+    u, v = y[:N*N], y[N*N:]
+    L = get_laplacian_matrix(N)
+    vv, uv2 = v*v, 2*u*v
+    return bmat([[Du*L - diags(vv + f), diags(-uv2)],
+                 [diags(vv), Dv*L + diags(uv2 - (f + k))]], format='csc')
+
+def gray_scott_sparsity(N):
+    ''' Sparsity pattern of the Jacobian of gray_scott: the 5-point stencil within each
+        component, and the local coupling between u and v.
+        Inputs:
+            N - the system size in each dimension
+        Outputs:
+            S - (2*N*N, 2*N*N) sparse matrix of ones where the Jacobian can be nonzero
+    '''
+    L = get_laplacian_matrix(N) != 0
+    I = identity(N*N, format='csr')
+    return bmat([[L, I], [I, L]], format='csc')
+
+# extent of the stability region of the explicit methods along the negative real axis
+STABILITY = {'RK23': 2.5, 'RK45': 3.3, 'DOP853': 6.}
+
+def solve_ivp_auto(fun, t_span, y0, t_eval, jac=None, jac_sparsity=None, explicit='RK23',
+                   implicit='BDF', rtol=1e-3, atol=1e-6, window=100, max_limited=0.5):
+    ''' Integrate an ODE like solve_ivp, starting with an explicit Runge–Kutta method and
+        switching to an implicit one once the problem turns stiff, i.e. once the step size is
+        limited by stability rather than accuracy. A step counts as limited if it had to be
+        rejected, or if h*rho is at the edge of the stability region of the method, with the
+        largest eigenvalue rho of the Jacobian estimated from the slopes within the step. For
+        large systems, the implicit solver needs either the Jacobian (jac) or the entries to
+        estimate by finite differences (jac_sparsity).
+        Inputs:
+            fun - the right-hand side fun(t, y)
+            t_span - start and end integration times
+            y0 - the initial state
+            t_eval - increasing output times in t_span
+            jac - function jac(t, y) returning the (sparse) Jacobian, or None
+            jac_sparsity - sparsity pattern of the Jacobian, used if jac is None
+            explicit - 'RK23', 'RK45' or 'DOP853', or None to start with the implicit method
+            implicit - 'BDF' or 'Radau', or None to never switch
+            rtol, atol - tolerance for tuning the accuracy of the solver
+            window - the number of recent steps checked for stiffness
+            max_limited - the fraction of limited steps in the window that triggers the switch
+        Outputs:
+            y - (len(y0), len(t_eval)) array of the solution at the output times
+            t_switch - the time of the switch to the implicit method, or None
+    '''
+    t_eval = np.asarray(t_eval)
+    out = np.empty((len(y0), len(t_eval)))
+    n, t_switch = 0, None
+
+    def start(method, t, y):
+        options = {'jac': jac, 'jac_sparsity': jac_sparsity} if method in ('BDF', 'Radau') else {}
+        return getattr(integrate, method)(fun, t, y, t_span[1], rtol=rtol, atol=atol, **options)
+
+    if explicit is None:
+        solver, t_switch = start(implicit, t_span[0], y0), t_span[0]
+    else:
+        solver = start(explicit, t_span[0], y0)
+    limited = deque(maxlen=window)
+    while solver.status == 'running':
+        nfev = solver.nfev
+        message = solver.step()
+        if solver.status == 'failed':
+            raise RuntimeError(message)
+        # interpolate the output times within the step
+        dense = None
+        while n < len(t_eval) and t_eval[n] <= solver.t:
+            if dense is None:
+                dense = solver.dense_output()
+            out[:,n] = dense(t_eval[n])
+            n += 1
+        if t_switch is None and implicit is not None:
+            # every attempt at a step costs n_stages evaluations, all but the last are rejected
+            rejected = solver.nfev - nfev > solver.n_stages
+            # rho from the slopes at the end of the step and at the latest stage, which are
+            # evaluated at (nearly) the same time, so that a uniform drift of y cancels out
+            h, i = solver.t - solver.t_old, np.argmax(solver.C)
+            dy = np.linalg.norm(solver.y - solver.y_old - h*(solver.A[i,:i] @ solver.K[:i]))
+            hrho = h*np.linalg.norm(solver.K[-1] - solver.K[i])/dy if dy > 0 else 0.
+            limited.append(rejected or hrho > 0.8*STABILITY[explicit])
+            if len(limited) == window and sum(limited) > max_limited*window:
+                solver, t_switch = start(implicit, solver.t, solver.y), solver.t
+    return out, t_switch
+
+def solve_stiff(func, ti, tf, nt, yi, args, jac=gray_scott_jacobian, explicit='RK23',
+                implicit='BDF', rtol=1e-3, atol=1e-6):
+    ''' Integrates the Gray–Scott model like solve, but with solve_ivp_auto, which switches
+        to an implicit method with a sparse Jacobian when the problem turns stiff.
+        Inputs:
+            func - the function to integrate
+            ti, tf - start and end integration times
+            nt - number of evenly spaced output time points in [ti, tf]
+            yi - initial concentrations [u, v]
+            args - tuples of model parameters (Du, Dv, f, k)
+            jac - function with the arguments of func returning its sparse Jacobian, or None
+                  to estimate it by finite differences over gray_scott_sparsity
+            explicit, implicit - the methods used before and after the switch (see
+                                 solve_ivp_auto)
+            rtol, atol - tolerance for tuning the accuracy of the solver
+        Outputs:
+            u - (N, N, nt) array of the concentration of u at the output times
+    '''
+    u, v = yi
+    N = len(u)
+    t_eval = np.linspace(ti, tf, nt)
+    options = {'jac_sparsity': gray_scott_sparsity(N)} if jac is None else \
+              {'jac': lambda t, y: jac(t, y, N, *args)}
+
+    start_time = time.time()
+    y, t_switch = solve_ivp_auto(lambda t, y: func(t, y, N, *args), [ti, tf],
+                                 np.hstack([u.ravel(), v.ravel()]), t_eval, explicit=explicit,
+                                 implicit=implicit, rtol=rtol, atol=atol, **options)
+    print('elapsed time (s):', time.time() - start_time)
+    if t_switch is not None:
+        print('switched to', implicit, 'at t =', t_switch)
+
+    return y[:N*N,:].reshape(N, N, nt)
+
+@njit
+def gray_scott_batch_step(u, v, un, vn, dt, Du, Dv, f, k, invh2):
+    ''' Take one forward Euler step of a batch of Gray–Scott systems with their own feed and
+        kill rates, as in gray_scott_step.
+        Inputs:
+            u, v - (B, N, M) arrays of the current concentrations
+            un, vn - (B, N, M) arrays for the new concentrations
+            dt - the time step
+            Du, Dv - the diffusion constants
+            f, k - (B,) arrays of the feed and kill rates
+            invh2 - the inverse squared lattice spacing
+    '''
+    B, N, M = u.shape
+    for b in range(B):
+        fb, kb = f[b], k[b]
+        for i in range(N):
+            im = i-1 if i > 0 else N-1
+            ip = i+1 if i < N-1 else 0
+            for j in range(M):
+                jm = j-1 if j > 0 else M-1
+                jp = j+1 if j < M-1 else 0
+                uc, vc = u[b,i,j], v[b,i,j]
+                Lu = ((u[b,im,j] - uc) + (u[b,ip,j] - uc) + (u[b,i,jm] - uc) + (u[b,i,jp] - uc))*invh2
+                Lv = ((v[b,im,j] - vc) + (v[b,ip,j] - vc) + (v[b,i,jm] - vc) + (v[b,i,jp] - vc))*invh2
+                uvv = uc*vc*vc
+                un[b,i,j] = uc + dt*(Du*Lu - uvv + fb - fb*uc)
+                vn[b,i,j] = vc + dt*(Dv*Lv + uvv - (fb + kb)*vc)
+
+def init_atlas_concentrations(N, seed=0):
+    ''' Initialize concentrations for a parameter sweep: u=1, v=0 except for a square of
+        u=0.5, v=0.25 in the middle, with 1% noise (as in Pearson's classification). '''
+    rng = np.random.default_rng(seed)
+    u, v = np.ones((N, N)), np.zeros((N, N))
+    c = slice(N//2 - N//10, N//2 + N//10 + 1)
+    u[c,c], v[c,c] = 0.5, 0.25
+    return u + 0.01*rng.standard_normal((N, N)), v + 0.01*rng.standard_normal((N, N))
+
+def describe_pattern(u, threshold=0.5):
+    ''' Summarize a pattern by its number of features (connected regions with u below a
+        threshold, joined across the periodic boundaries) and the fraction of the grid
+        they cover. Many small features are spots, few large ones are stripes or mazes. '''
+    mask = u < threshold
+    labels, count = ndimage.label(mask)
+    if count == 0:
+        return 0, 0.
+    # merge the features that touch across the periodic boundaries
+    pairs = np.concatenate([np.stack([labels[0], labels[-1]], axis=1),
+                            np.stack([labels[:,0], labels[:,-1]], axis=1)])
+    pairs = pairs[(pairs > 0).all(axis=1)] - 1
+    graph = coo_matrix((np.ones(len(pairs)), (pairs[:,0], pairs[:,1])), shape=(count, count))
+    return connected_components(graph, directed=False)[0], mask.mean()
+
+def _sweep_batch(fs, ks, N, T, dt, Du, Dv, seed, dtype):
+    # integrate a batch of parameter pairs from the same initial state, and return the
+    # final patterns, their descriptors and the largest change over the last tenth of the run
+    u0, v0 = init_atlas_concentrations(N, seed)
+    B = len(fs)
+    u = np.repeat(u0[None].astype(dtype), B, axis=0)
+    v = np.repeat(v0[None].astype(dtype), B, axis=0)
+    un, vn = np.empty_like(u), np.empty_like(v)
+    cast = np.dtype(dtype).type
+    f, k = np.asarray(fs, dtype=dtype), np.asarray(ks, dtype=dtype)
+    params = [cast(x) for x in (dt, Du, Dv)] + [f, k, cast(1./(2./N)**2)]
+    steps = int(np.ceil(T/dt))
+    late = steps - max(steps//10, 1)
+    u_late = u.copy() # in case the run is too short to reach the late snapshot
+    for n in range(steps):
+        if n == late:
+            u_late = u.copy()
+        gray_scott_batch_step(u, v, un, vn, *params)
+        u, un, v, vn = un, u, vn, v
+    change = np.abs(u - u_late).max(axis=(1, 2))
+    stats = np.array([describe_pattern(ub) for ub in u])
+    return u, stats[:,0], stats[:,1], change
+
+def gray_scott_atlas(fs, ks, N=64, T=5000, dt=1., Du=2e-5, Dv=1e-5, batch=64, workers=None,
+                     seed=0, dtype=np.float32, tol=1e-3):
+    ''' Map the Gray–Scott phase diagram: integrate every pair of feed and kill rates from the
+        same initial state, in batches of parameter pairs stacked into (batch, N, N) arrays
+        that are spread over a process pool.
+        Inputs:
+            fs, ks - 1D arrays of the feed and kill rates
+            N - the system size in each dimension
+            T - the integration time
+            dt - the time step (see solve_gray_scott for the stability limit)
+            Du, Dv - the diffusion constants
+            batch - the number of parameter pairs integrated together
+            workers - the number of processes (default None, one per CPU)
+            seed - random seed of the initial state (see init_atlas_concentrations)
+            dtype - np.float32 or np.float64
+            tol - largest change of u over the last tenth of the run of a steady pattern
+        Outputs:
+            patterns - (len(ks), len(fs), N, N) array of the final concentrations of u
+            stats - dictionary of (len(ks), len(fs)) arrays: 'count', the number of features,
+                    'fill', the fraction of the grid they cover, 'change', the largest change
+                    of u over the last tenth of the run, and 'steady', whether it is below tol
+    '''
+    F, K = np.meshgrid(fs, ks)
+    F, K = F.ravel(), K.ravel()
+    chunks = [slice(i, i + batch) for i in range(0, len(F), batch)]
+    args = (N, T, dt, Du, Dv, seed, dtype)
+    start_time = time.time()
+    if workers == 1:
+        results = [_sweep_batch(F[c], K[c], *args) for c in chunks]
+    else:
+        # start fresh processes: forking after numba has started its threads can hang
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = [pool.submit(_sweep_batch, F[c], K[c], *args) for c in chunks]
+            results = [fut.result() for fut in futures]
+    print('elapsed time (s):', time.time() - start_time)
+
+    shape = (len(ks), len(fs))
+    patterns = np.concatenate([r[0] for r in results]).reshape(shape + (N, N))
+    count, fill, change = (np.concatenate([r[i] for r in results]).reshape(shape) for i in (1, 2, 3))
+    stats = {'count': count.astype(int), 'fill': fill, 'change': change, 'steady': change < tol}
+    return patterns, stats
+
+def atlas_image(patterns, gap=1, background=1.):
+    ''' Tile the patterns of gray_scott_atlas into a single image, with the feed rate
+        increasing from left to right and the kill rate from top to bottom.
+        Inputs:
+            patterns - (nk, nf, N, N) array of patterns
+            gap - the number of pixels between tiles
+            background - the value of the gaps
+        Outputs:
+            im - (nk*(N+gap)-gap, nf*(N+gap)-gap) image
+    '''
+    nk, nf, N, M = patterns.shape
+    im = np.full((nk, N+gap, nf, M+gap), background, dtype=patterns.dtype)
+    im[:,:N,:,:M] = patterns.transpose(0, 2, 1, 3)
+    return im.reshape(nk*(N+gap), nf*(M+gap))[:-gap or None,:-gap or None]
@@ -0,0 +1,589 @@
+import os
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse import coo_matrix
+from numba import njit
+
+# record layout of a binary STL triangle
+STL_DTYPE = np.dtype([('normal', '<f4', (3,)), ('vertices', '<f4', (3,3)), ('attr', '<u2')])
+
+def write_stl(filename, verts, tris, name='generative-art'):
+    ''' Write a triangle mesh as a binary STL file.
+        Inputs:
+            filename - path of the STL file
+            verts - (V, 3) array of vertex coordinates
+            tris - (T, 3) array of vertex indices of the triangles, counterclockwise
+                   seen from outside
+            name - text of the 80 byte header
+    '''
+    p = verts[tris]
+    n = np.cross(p[:,1] - p[:,0], p[:,2] - p[:,0])
+    length = np.linalg.norm(n, axis=1, keepdims=True)
+    data = np.zeros(len(tris), dtype=STL_DTYPE)
+    data['normal'] = np.divide(n, length, out=np.zeros_like(n), where=length > 0)
+    data['vertices'] = p
+    with open(filename, 'wb') as f:
+        f.write(name.encode()[:80].ljust(80, b'\0'))
+        f.write(np.uint32(len(tris)).tobytes())
+        data.tofile(f)
+
+def read_stl(filename):
+    ''' Read the triangles of a STL file. Binary files are memory-mapped rather than
+        loaded, so that large meshes are only read as far as they are used.
+        Inputs:
+            filename - path of the STL file (binary or ASCII)
+        Outputs:
+            tris - (T, 3, 3) float32 array of the vertex coordinates of the triangles
+    '''
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as f:
+        head = f.read(84)
+    # some binary files start with 'solid' too, so check the size of the file instead
+    if size >= 84 and size == 84 + STL_DTYPE.itemsize*int(np.frombuffer(head[80:84], '<u4')[0]):
+        return np.memmap(filename, dtype=STL_DTYPE, mode='r', offset=84)['vertices']
+    with open(filename) as f:
+        words = f.read().split()
+    words = np.array(words)
+    i = np.flatnonzero(words == 'vertex')
+    coords = words[(i[:,None] + [1,2,3]).ravel()].astype(np.float32)
+    return coords.reshape(-1, 3, 3)
+
+def merge_vertices(verts, tol, period=None):
+    ''' Merge vertices closer than tol to each other.
+        Inputs:
+            verts - (V, 2) array of vertices
+            tol - merging distance
+            period - period in x (default None, not periodic)
+        Outputs:
+            labels - (V,) array of the index of each vertex among the merged vertices
+            count - number of merged vertices
+    '''
+    if period is not None:
+        verts = np.copy(verts)
+        verts[:,0] %= period
+        verts[verts[:,0] >= period, 0] -= period
+        tree = cKDTree(verts, boxsize=[period, 0])
+    else:
+        tree = cKDTree(verts)
+    pairs = tree.query_pairs(tol, output_type='ndarray')
+    V = len(verts)
+    graph = coo_matrix((np.ones(len(pairs)), (pairs[:,0], pairs[:,1])), shape=(V,V))
+    count, labels = connected_components(graph, directed=False)
+    return labels, count
+
+@njit
+def _inset_polygon(poly, dist):
+    # Intersect the half-planes at distance dist[j] inside each edge j of a convex,
+    # counterclockwise polygon, by clipping the polygon with each of them in turn.
+    # Returns the vertices of the inset polygon and the index of the polygon edge that
+    # each of its edges (from vertex i to i+1) lies on.
+    k = len(poly)
+    normals = np.zeros((k,2))
+    offsets = np.zeros(k)
+    for j in range(k):
+        a = poly[j]
+        b = poly[(j+1)%k]
+        length = np.sqrt((b[0]-a[0])**2 + (b[1]-a[1])**2)
+        normals[j,0] = -(b[1]-a[1])/length
+        normals[j,1] = (b[0]-a[0])/length
+        offsets[j] = normals[j,0]*a[0] + normals[j,1]*a[1] + dist[j]
+
+    cur = poly.copy()
+    labels = np.arange(k)
+    for j in range(k):
+        n = len(cur)
+        if n == 0:
+            break
+        s = cur[:,0]*normals[j,0] + cur[:,1]*normals[j,1] - offsets[j]
+        new = np.zeros((2*n,2))
+        new_labels = np.zeros(2*n, dtype=np.int64)
+        m = 0
+        for i in range(n):
+            i1 = (i+1) % n
+            if s[i] >= 0:
+                new[m] = cur[i]
+                new_labels[m] = labels[i]
+                m += 1
+            if (s[i] >= 0) != (s[i1] >= 0):
+                t = s[i]/(s[i] - s[i1])
+                new[m] = cur[i] + t*(cur[i1] - cur[i])
+                # an edge leaving the half-plane continues along the clipping line
+                new_labels[m] = j if s[i] >= 0 else labels[i]
+                m += 1
+        cur = new[:m]
+        labels = new_labels[:m]
+
+    # drop vertices that coincide with the next one, keeping the label of the edge after
+    n = len(cur)
+    keep = np.ones(n, dtype=np.bool_)
+    for i in range(n-1, -1, -1):
+        i1 = (i+1) % n
+        if i1 != i and keep[i1] and (cur[i,0]-cur[i1,0])**2 + (cur[i,1]-cur[i1,1])**2 < 1e-20:
+            keep[i1] = False
+            labels[i] = labels[i1]
+    cur = cur[keep]
+    labels = labels[keep]
+    if len(cur) < 3:
+        return np.zeros((0,2)), np.zeros(0, dtype=np.int64)
+    return cur, labels
+
+@njit
+def _edge_point(o, j, q, segs, mids, fwd):
+    # vertex q of the subdivided edge j of a cell with vertices o
+    s = segs[j]
+    if q == 0:
+        return o[j]
+    if q == s:
+        return o[(j+1) % len(o)]
+    return mids[j] + (q-1 if fwd[j] else s-1-q)
+
+@njit
+def _wall_triangles(pos, ids, ptr, dist, segs, mids, fwd, first):
+    # Triangulate the walls between each cell and its inset polygon. The walls along
+    # the polygon edges that survive the inset are strips of quads, and the walls along
+    # the edges that vanish are triangles fanning around the inset vertex where they
+    # vanished. Edge j of a cell is split into segs[j] segments, with the vertices in
+    # between numbered from mids[j] (in reverse if not fwd[j]).
+    N = len(ptr) - 1
+    size = np.sum(segs) + len(pos)
+    inner = np.zeros((size,2))
+    tris = np.zeros((2*size,3), dtype=np.int64)
+    nv = 0
+    nt = 0
+    for c in range(N):
+        lo, hi = ptr[c], ptr[c+1]
+        o, sg, md, fw = ids[lo:hi], segs[lo:hi], mids[lo:hi], fwd[lo:hi]
+        k = len(o)
+        hole, labels = _inset_polygon(pos[lo:hi], dist[lo:hi])
+        h = len(hole)
+        if h == 0:
+            # the cell is filled: fan around its center
+            inner[nv,0] = np.mean(pos[lo:hi,0])
+            inner[nv,1] = np.mean(pos[lo:hi,1])
+            for j in range(k):
+                for q in range(sg[j]):
+                    p0 = _edge_point(o, j, q, sg, md, fw)
+                    p1 = _edge_point(o, j, q+1, sg, md, fw)
+                    tris[nt,0], tris[nt,1], tris[nt,2] = first+nv, p0, p1
+                    nt += 1
+            nv += 1
+            continue
+
+        # inset vertices, then the points splitting each inset edge
+        start = nv
+        inner[nv:nv+h] = hole
+        nv += h
+        for a in range(h):
+            b = (a+1) % h
+            j = labels[a]
+            s = sg[j]
+            ia, ib = first+start+a, first+start+b
+            prev = ia
+            for q in range(s):
+                if q < s-1:
+                    t = (q+1)/s
+                    inner[nv] = hole[a] + t*(hole[b] - hole[a])
+                    cur = first + nv
+                    nv += 1
+                else:
+                    cur = ib
+                p0 = _edge_point(o, j, q, sg, md, fw)
+                p1 = _edge_point(o, j, q+1, sg, md, fw)
+                tris[nt,0], tris[nt,1], tris[nt,2] = p0, p1, cur
+                tris[nt+1,0], tris[nt+1,1], tris[nt+1,2] = p0, cur, prev
+                nt += 2
+                prev = cur
+            m = (j+1) % k
+            while m != labels[b]:
+                for q in range(sg[m]):
+                    p0 = _edge_point(o, m, q, sg, md, fw)
+                    p1 = _edge_point(o, m, q+1, sg, md, fw)
+                    tris[nt,0], tris[nt,1], tris[nt,2] = p0, p1, ib
+                    nt += 1
+                m = (m+1) % k
+    return inner[:nv], tris[:nt]
+
+def voronoi_walls(vor, n, bounds, width, rim=None, seg=None):
+    ''' Triangulate the walls of a Voronoi pattern that is periodic in x, as computed by
+        periodic_voronoi: the strip minus the cells of the first n points, each inset by
+        half the wall width.
+        Inputs:
+            vor - scipy Voronoi diagram
+            n - number of cells in the strip
+            bounds - (xmin, xmax, ymin, ymax) of the strip
+            width - width of the walls between the cells
+            rim - width of the walls along the bottom and top (default None, width/2)
+            seg - maximum length of the wall segments, so that they bend smoothly around
+                  a cylinder (default None, (xmax - xmin)/180)
+        Outputs:
+            verts - (V, 2) array of vertices, with x wrapped into [xmin, xmax)
+            tris - (T, 3) array of counterclockwise triangles
+    '''
+    xmin, xmax, ymin, ymax = bounds
+    lx = xmax - xmin
+    tol = 1e-9*max(lx, ymax - ymin)
+    rim = 0.5*width if rim is None else rim
+    seg = lx/180 if seg is None else seg
+
+    # flatten the regions of the cells (once for repeated points), counterclockwise
+    regions = [vor.regions[r] for r in np.unique(vor.point_region[:n])]
+    ptr = np.cumsum([0] + [len(r) for r in regions])
+    ids = np.fromiter((v for r in regions for v in r), dtype=np.int64, count=ptr[-1])
+    pos = np.copy(vor.vertices[ids])
+    pos[np.abs(pos[:,1] - ymin) < tol, 1] = ymin
+    pos[np.abs(pos[:,1] - ymax) < tol, 1] = ymax
+    nxt = np.arange(len(ids)) + 1
+    nxt[ptr[1:]-1] = ptr[:-1]
+    area = np.add.reduceat(pos[:,0]*pos[nxt,1] - pos[nxt,0]*pos[:,1], ptr[:-1])
+    order = np.arange(len(ids))
+    for c in np.flatnonzero(area < 0):
+        order[ptr[c]:ptr[c+1]] = order[ptr[c]:ptr[c+1]][::-1]
+    pos = pos[order]
+
+    # merge the copies of the vertices across the seam (and the repeated vertices of
+    # degenerate cells), then drop repeated vertices along each cell
+    labels, count = merge_vertices(pos, tol, period=lx)
+    keep = labels != labels[nxt]
+    ids = labels[keep]
+    pos = pos[keep]
+    ptr = np.cumsum(np.r_[0, np.add.reduceat(keep, ptr[:-1])])
+    nxt = np.arange(len(ids)) + 1
+    nxt[ptr[1:]-1] = ptr[:-1]
+    verts = np.zeros((count,2))
+    verts[ids] = pos
+
+    # split the edges into segments, numbering the points in between once per edge
+    # shared by two cells, from its lower to its higher vertex
+    a, b = ids, ids[nxt]
+    edges, first, inv = np.unique(np.minimum(a,b)*count + np.maximum(a,b), return_index=True, return_inverse=True)
+    segs = np.ones(len(edges), dtype=np.int64)
+    np.maximum.at(segs, inv, np.ceil(np.linalg.norm(pos[nxt] - pos, axis=1)/seg).astype(np.int64))
+    mids = count + np.cumsum(np.r_[0, segs[:-1] - 1])
+    fwd = a[first] < b[first]
+    p0 = np.where(fwd[:,None], pos[first], pos[nxt[first]])
+    p1 = np.where(fwd[:,None], pos[nxt[first]], pos[first])
+    e = np.repeat(np.arange(len(edges)), segs - 1)
+    t = (np.arange(len(e)) - (mids - count)[e] + 1)/segs[e]
+    verts = np.vstack([verts, p0[e] + t[:,None]*(p1[e] - p0[e])])
+
+    # inset each edge by half the wall width, or by the rim width along the boundary
+    boundary = ((pos[:,1] == ymin) & (pos[nxt,1] == ymin)) | ((pos[:,1] == ymax) & (pos[nxt,1] == ymax))
+    dist = np.where(boundary, rim, 0.5*width)
+    inner, tris = _wall_triangles(pos, ids, ptr, dist, segs[inv], mids[inv], a < b, len(verts))
+    verts = np.vstack([verts, inner])
+    verts[:,0] = xmin + (verts[:,0] - xmin) % lx
+    return verts, tris
+
+def wrap_cylinder(verts, tris, bounds, thickness, radius=None):
+    ''' Wrap a 2D triangle mesh of a strip periodic in x around a cylinder, and extrude
+        it inwards into a closed solid.
+        Inputs:
+            verts - (V, 2) array of vertices
+            tris - (T, 3) array of counterclockwise triangles
+            bounds - (xmin, xmax, ymin, ymax) of the strip, with x wrapping around the
+                     cylinder and y along its axis
+            thickness - thickness of the solid
+            radius - outer radius of the cylinder (default None, (xmax - xmin)/(2 pi), so
+                     that lengths along the outer surface are preserved)
+        Outputs:
+            verts - (2V, 3) array of vertices, outer ones first
+            tris - (T', 3) array of triangles, counterclockwise seen from outside
+    '''
+    xmin, xmax, ymin, ymax = bounds
+    V = len(verts)
+    radius = (xmax - xmin)/(2*np.pi) if radius is None else radius
+    theta = 2*np.pi*(verts[:,0] - xmin)/(xmax - xmin)
+    r = np.repeat([radius, radius - thickness], V)
+    verts3 = np.stack([r*np.tile(np.cos(theta), 2), r*np.tile(np.sin(theta), 2), np.tile(verts[:,1], 2)], axis=1)
+
+    # edges used by a single triangle bound the mesh, with the mesh on their left
+    edges = np.vstack([tris[:,[0,1]], tris[:,[1,2]], tris[:,[2,0]]])
+    boundary = edges[~np.isin(edges[:,0]*V + edges[:,1], edges[:,1]*V + edges[:,0])]
+    a, b = boundary[:,0], boundary[:,1]
+    sides = np.vstack([np.stack([a+V, b+V, b], axis=1), np.stack([a+V, b, a], axis=1)])
+    return verts3, np.vstack([tris, tris[:,::-1] + V, sides])
+
+def voronoi_lamp(vor, n, bounds, width, thickness, rim=None, seg=None, radius=None, filename=None):
+    ''' Build a cylindrical lamp from the walls of a Voronoi pattern periodic in x, and
+        optionally write it as a binary STL file.
+        Inputs:
+            vor, n, bounds, width, rim, seg - Voronoi pattern and walls (see voronoi_walls)
+            thickness, radius - extrusion (see wrap_cylinder)
+            filename - path of the STL file (default None, do not write)
+        Outputs:
+            verts - (V, 3) array of vertices
+            tris - (T, 3) array of triangles, counterclockwise seen from outside
+    '''
+    verts, tris = voronoi_walls(vor, n, bounds, width, rim, seg)
+    verts, tris = wrap_cylinder(verts, tris, bounds, thickness, radius)
+    if filename is not None:
+        write_stl(filename, verts, tris)
+    return verts, tris
+
+def overhang_angles(tris):
+    ''' Compute the overhang angle of each face: 0 for vertical faces up to 90 degrees for
+        faces facing straight down, measured from the vertical as in the 45/60 degree
+        rules of thumb for printing without support. Faces facing up, and faces lying on
+        the bed (at the lowest z of the model), get nan.
+        Inputs:
+            tris - (T, 3, 3) array of triangles, counterclockwise seen from outside
+        Outputs:
+            angles - (T,) array of overhang angles in degrees
+    '''
+    tris = np.asarray(tris, dtype=np.float64)
+    n = np.cross(tris[:,1] - tris[:,0], tris[:,2] - tris[:,0])
+    length = np.linalg.norm(n, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        angles = np.degrees(np.arcsin(np.clip(-n[:,2]/length, -1, 1)))
+    zmin = tris[:,:,2].min()
+    angles[(angles <= 0) | (tris[:,:,2].max(axis=1) <= zmin + 1e-6*np.ptp(tris[:,:,2]))] = np.nan
+    return angles
+
+def overhang_report(tris, thresholds=(45, 60)):
+    ''' Print the number and area of the faces that overhang more than each threshold.
+        Inputs:
+            tris - (T, 3, 3) array of triangles, counterclockwise seen from outside
+            thresholds - overhang angles in degrees
+        Outputs:
+            masks - dictionary of the (T,) boolean masks of the faces beyond each threshold
+    '''
+    tris = np.asarray(tris, dtype=np.float64)
+    angles = overhang_angles(tris)
+    area = 0.5*np.linalg.norm(np.cross(tris[:,1] - tris[:,0], tris[:,2] - tris[:,0]), axis=1)
+    masks = {}
+    for t in thresholds:
+        with np.errstate(invalid='ignore'):
+            masks[t] = angles > t
+        print("Overhang above %g degrees: %d faces, %.2f%% of the surface area"
+              % (t, masks[t].sum(), 100*area[masks[t]].sum()/area.sum()))
+    return masks
+
+def slice_mesh(tris, layer_height=0.2):
+    ''' Slice a triangle mesh into layers, with planes at the middle of each layer. Each
+        triangle is only intersected with the planes within its own z-range, and the
+        segments are oriented with the inside of the mesh on their left.
+        Inputs:
+            tris - (T, 3, 3) array of triangles, counterclockwise seen from outside
+            layer_height - distance between the planes
+        Outputs:
+            z - (L,) array of the heights of the planes
+            segs - (S, 2, 2) array of the segments, sorted by layer
+            ptr - start of the segments of each layer in segs (length L+1)
+    '''
+    tris = np.asarray(tris, dtype=np.float64)
+    tz = tris[:,:,2]
+    zmin, zmax = tz.min(), tz.max()
+    L = max(int(np.ceil((zmax - zmin)/layer_height)), 1)
+    z = zmin + (np.arange(L) + 0.5)*layer_height
+
+    # bin the triangles by the range of planes they span
+    lo = np.searchsorted(z, tz.min(axis=1), side='left')
+    hi = np.searchsorted(z, tz.max(axis=1), side='right') - 1
+    count = np.maximum(hi - lo + 1, 0)
+    t = np.repeat(np.arange(len(tris)), count)
+    layer = np.repeat(lo - np.cumsum(np.r_[0, count[:-1]]), count) + np.arange(len(t))
+    order = np.argsort(layer, kind='stable')
+    t, layer = t[order], layer[order]
+
+    # vertices on a plane count as above it, so each crossed triangle has exactly two
+    # edges with a vertex on each side
+    p = tris[t]
+    above = p[:,:,2] >= z[layer][:,None]
+    crossed = above.any(axis=1) & ~above.all(axis=1)
+    p, above, layer = p[crossed], above[crossed], layer[crossed]
+    zl = z[layer]
+    ends = []
+    for k in range(3):
+        a, b = p[:,k], p[:,(k+1)%3]
+        # interpolate from the lower vertex, so that the two triangles sharing an edge
+        # compute exactly the same point, and take the upper vertex if it is on the plane
+        swap = a[:,2] > b[:,2]
+        a, b = np.where(swap[:,None], b, a), np.where(swap[:,None], a, b)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            s = ((zl - a[:,2])/(b[:,2] - a[:,2]))[:,None]
+            q = np.where((b[:,2] == zl)[:,None], b[:,:2], a[:,:2] + s*(b[:,:2] - a[:,:2]))
+        ends.append((above[:,k] != above[:,(k+1)%3], q))
+
+    # the two crossed edges give the endpoints, oriented by the normal of the face
+    first = np.where(ends[0][0], 0, 1)
+    second = np.where(ends[2][0], 2, 1)
+    pts = np.stack([e[1] for e in ends], axis=1)
+    i = np.arange(len(p))
+    segs = np.stack([pts[i,first], pts[i,second]], axis=1)
+    n = np.cross(p[:,1] - p[:,0], p[:,2] - p[:,0])
+    d = segs[:,1] - segs[:,0]
+    flip = d[:,1]*n[:,0] - d[:,0]*n[:,1] < 0
+    segs[flip] = segs[flip,::-1]
+
+    # triangles touching a plane at a single vertex give empty segments
+    keep = (segs[:,0] != segs[:,1]).any(axis=1)
+    segs, layer = segs[keep], layer[keep]
+    ptr = np.searchsorted(layer, np.arange(L+1))
+    return z, segs, ptr
+
+@njit
+def _chain_segments(succ, has_pred):
+    # order the segments into chains following succ, open chains first
+    S = len(succ)
+    order = np.zeros(S, dtype=np.int64)
+    starts = np.zeros(S+1, dtype=np.int64)
+    closed = np.zeros(S, dtype=np.bool_)
+    seen = np.zeros(S, dtype=np.bool_)
+    n = 0
+    c = 0
+    for sweep in range(2):
+        for s in range(S):
+            if seen[s] or (sweep == 0 and has_pred[s]):
+                continue
+            starts[c] = n
+            closed[c] = sweep == 1
+            while s >= 0 and not seen[s]:
+                seen[s] = True
+                order[n] = s
+                n += 1
+                s = succ[s]
+            c += 1
+    starts[c] = n
+    return order, starts[:c+1], closed[:c]
+
+def get_contours(segs, ptr):
+    ''' Link the segments of each layer into contours, by matching the end of each
+        segment with the start of another.
+        Inputs:
+            segs - (S, 2, 2) array of segments, sorted by layer
+            ptr - start of the segments of each layer in segs
+        Outputs:
+            pts - (P, 2) array of the points of the contours, closed contours ending with
+                  their first point
+            cptr - start of each contour in pts (length C+1)
+            clayer - (C,) array of the layer of each contour
+            closed - (C,) boolean array of whether each contour is closed (otherwise the
+                     mesh has holes)
+    '''
+    S = len(segs)
+    layer = np.repeat(np.arange(len(ptr)-1), np.diff(ptr))
+    # number the distinct points of each layer
+    x = np.r_[segs[:,0,0], segs[:,1,0]]
+    y = np.r_[segs[:,0,1], segs[:,1,1]]
+    l = np.r_[layer, layer]
+    order = np.lexsort((y, x, l))
+    new = np.r_[True, (np.diff(x[order]) != 0) | (np.diff(y[order]) != 0) | (np.diff(l[order]) != 0)]
+    pid = np.empty(2*S, dtype=np.int64)
+    pid[order] = np.cumsum(new) - 1
+    start_of = -np.ones(pid.max()+1 if S else 0, dtype=np.int64)
+    start_of[pid[:S]] = np.arange(S)
+    succ = start_of[pid[S:]]
+    has_pred = np.zeros(S, dtype=bool)
+    has_pred[succ[succ >= 0]] = True
+    seg_order, starts, closed = _chain_segments(succ, has_pred)
+
+    # each chain visits the starts of its segments, then the end of its last segment,
+    # which is the first point again for closed contours
+    ends = np.zeros(len(seg_order), dtype=bool)
+    ends[starts[1:] - 1] = True
+    reps = 1 + ends
+    pts = np.repeat(segs[seg_order,0], reps, axis=0)
+    pts[np.cumsum(reps)[ends] - 1] = segs[seg_order[ends],1]
+    cptr = np.r_[0, np.cumsum(reps)][starts]
+    clayer = layer[seg_order[starts[:-1]]]
+    return pts, cptr, clayer, closed
+
+@njit
+def _fill_layer(segs, x0, y0, dx, dy, image):
+    # even-odd scanline fill of the polygon formed by segments, at the pixel centers
+    ny, nx = image.shape
+    counts = np.zeros((ny, nx+1), dtype=np.int64)
+    for s in range(len(segs)):
+        ax, ay = segs[s,0]
+        bx, by = segs[s,1]
+        if ay > by:
+            ax, ay, bx, by = bx, by, ax, ay
+        i0 = max(int(np.ceil((ay - y0)/dy - 0.5)), 0)
+        i1 = min(int(np.ceil((by - y0)/dy - 0.5)), ny)
+        for i in range(i0, i1):
+            yc = y0 + (i + 0.5)*dy
+            xc = ax + (yc - ay)*(bx - ax)/(by - ay)
+            j = min(max(int(np.ceil((xc - x0)/dx - 0.5)), 0), nx)
+            counts[i,j] += 1
+    for i in range(ny):
+        c = 0
+        for j in range(nx):
+            c += counts[i,j]
+            image[i,j] = c % 2 == 1
+
+def layer_images(segs, ptr, layers=None, bounds=None, resolution=0.1):
+    ''' Rasterize layers into images of the inside of the mesh.
+        Inputs:
+            segs, ptr - segments of the layers (see slice_mesh)
+            layers - indices of the layers to rasterize (default None, all)
+            bounds - (xmin, xmax, ymin, ymax) of the images (default None, of all segments)
+            resolution - pixel size
+        Outputs:
+            images - (len(layers), ny, nx) boolean array, with row 0 at ymin
+            bounds - (xmin, xmax, ymin, ymax) of the images
+    '''
+    if layers is None:
+        layers = np.arange(len(ptr)-1)
+    if bounds is None:
+        lo, hi = segs.min(axis=(0,1)), segs.max(axis=(0,1))
+        bounds = (lo[0], hi[0], lo[1], hi[1])
+    xmin, xmax, ymin, ymax = bounds
+    nx = max(int(np.ceil((xmax - xmin)/resolution)), 1)
+    ny = max(int(np.ceil((ymax - ymin)/resolution)), 1)
+    images = np.zeros((len(layers), ny, nx), dtype=bool)
+    for k, l in enumerate(layers):
+        _fill_layer(segs[ptr[l]:ptr[l+1]], xmin, ymin, resolution, resolution, images[k])
+    return images, bounds
+
+def save_layer_previews(folder, segs, ptr, layers=None, resolution=0.1):
+    ''' Save layers as PNG images layer_0000.png, ... in a folder.
+        Inputs:
+            folder - output folder, created if needed
+            segs, ptr - segments of the layers (see slice_mesh)
+            layers - indices of the layers to save (default None, all)
+            resolution - pixel size
+    '''
+    import matplotlib.pyplot as plt
+    os.makedirs(folder, exist_ok=True)
+    if layers is None:
+        layers = np.arange(len(ptr)-1)
+    images, _ = layer_images(segs, ptr, layers, resolution=resolution)
+    for l, im in zip(layers, images):
+        plt.imsave(os.path.join(folder, 'layer_%04d.png' % l), im[::-1], cmap='gray_r', vmin=0, vmax=1)
+
+def write_gcode(filename, z, pts, cptr, clayer, layer_height=0.2, line_width=0.4,
+                filament=1.75, speed=1800):
+    ''' Write the perimeters of the layers as simple G-code: each contour is printed
+        once, with the extrusion proportional to its length.
+        Inputs:
+            filename - path of the G-code file
+            z - (L,) array of the heights of the layers
+            pts, cptr, clayer - contours of the layers (see get_contours)
+            layer_height, line_width - size of the extruded line, in mm
+            filament - diameter of the filament, in mm
+            speed - printing speed, in mm/min
+    '''
+    # filament length per mm of printed line
+    rate = layer_height*line_width/(np.pi*(filament/2)**2)
+    seg = np.linalg.norm(np.diff(pts, axis=0), axis=1)
+    seg[cptr[1:-1]-1] = 0
+    E = np.r_[0, np.cumsum(seg)]*rate
+    zp = z - z[0] + layer_height
+
+    # travel to the first point of each contour (and up to each new layer), then print.
+    # The extrusion is absolute and does not change while travelling.
+    P = len(pts)
+    first = np.zeros(P, dtype=bool)
+    first[cptr[:-1]] = True
+    layer = np.repeat(clayer, np.diff(cptr))
+    up = first & (np.r_[-1, layer[:-1]] != layer)
+    lines = ['; perimeters of %d layers' % len(z), 'G21 ; millimeters', 'G90 ; absolute positions',
+             'M82 ; absolute extrusion', 'G28 ; home', 'G92 E0']
+    lines += [('G0 Z%.3f\n' % zp[l] if u else '') + 'G0 X%.3f Y%.3f' % (x, y) if f else
+              'G1 X%.3f Y%.3f E%.5f F%d' % (x, y, e, speed)
+              for x, y, e, f, u, l in zip(pts[:,0].tolist(), pts[:,1].tolist(), E.tolist(),
+                                          first.tolist(), up.tolist(), layer.tolist())]
+    lines += ['M104 S0 ; heater off', 'M84 ; motors off']
+    with open(filename, 'w') as f:
+        f.write('\n'.join(lines) + '\n')